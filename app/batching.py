@@ -0,0 +1,136 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Tuple
+
+import numpy as np
+
+ScoreFn = Callable[[Any, np.ndarray], Tuple[np.ndarray, np.ndarray]]
+
+
+class MicroBatcher:
+    """Coalesces concurrent single-row scoring calls into one matrix per model.
+
+    Callers block in submit() (or wait on the future of submit_nowait()) while
+    a daemon thread collects rows until either max_batch_size rows are queued
+    or max_wait_us microseconds have passed since the first one, scores them
+    with a single score_fn(model, matrix) call and hands each caller its own
+    (label, probability). Rows submitted for different model objects (around
+    a model reload) are scored separately, each with the model its caller
+    asked for.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        score_fn: ScoreFn,
+        max_batch_size: int = 32,
+        max_wait_us: int = 500,
+        stats_window: int = 10000,
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.name = name
+        self.score_fn = score_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_us = max_wait_us
+
+        self._queue: "queue.Queue[Tuple[np.ndarray, Any, Future, float]]" = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._latencies: Deque[Tuple[float, float]] = deque(maxlen=stats_window)
+        self._rows = 0
+        self._batches = 0
+
+    def submit(self, row: np.ndarray, model) -> Tuple[int, float]:
+        """Queue one feature vector and wait for its score by model."""
+        return self.submit_nowait(row, model).result()
+
+    def submit_nowait(self, row: np.ndarray, model) -> Future:
+        """Queue one feature vector; the returned future resolves to its (label, probability).
+
+        For callers that must not hold a thread while the batch fills, e.g. an
+        event loop awaiting it through asyncio.wrap_future.
+        """
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((row, model, future, time.perf_counter()))
+        return future
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            samples = list(self._latencies)
+            rows, batches = self._rows, self._batches
+
+        result = {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_us": self.max_wait_us,
+            "rows": rows,
+            "batches": batches,
+            "avg_batch_size": rows / batches if batches else 0.0,
+            "queue_depth": self._queue.qsize(),
+            "rows_per_second": 0.0,
+            "latency_p50_ms": 0.0,
+            "latency_p99_ms": 0.0,
+        }
+        if samples:
+            finished = np.array([s[0] for s in samples])
+            latencies = np.array([s[1] for s in samples]) * 1000.0
+            span = finished.max() - finished.min()
+            if span > 0:
+                result["rows_per_second"] = float(len(samples) / span)
+            result["latency_p50_ms"] = float(np.percentile(latencies, 50))
+            result["latency_p99_ms"] = float(np.percentile(latencies, 99))
+        return result
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, name=f"microbatch-{self.name}", daemon=True)
+                thread.start()
+                self._thread = thread
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_us / 1_000_000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            groups: dict = {}
+            for item in batch:
+                groups.setdefault(id(item[1]), []).append(item)
+            for group in groups.values():
+                self._score(group)
+
+    def _score(self, batch: list) -> None:
+        try:
+            labels, probas = self.score_fn(batch[0][1], np.vstack([row for row, _, _, _ in batch]))
+        except Exception as exc:  # propagate to every waiting caller
+            for _, _, future, _ in batch:
+                future.set_exception(exc)
+            return
+
+        now = time.perf_counter()
+        for (_, _, future, enqueued), label, proba in zip(batch, labels, probas):
+            future.set_result((int(label), float(proba)))
+        with self._stats_lock:
+            self._rows += len(batch)
+            self._batches += 1
+            self._latencies.extend((now, now - enqueued) for _, _, _, enqueued in batch)
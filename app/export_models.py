@@ -0,0 +1,91 @@
+"""Export the pickled models to the parameter format read by the model registry.
+
+For every registered model (or the codes given) the .sav file is unpickled
+once, compiled to a LinearModel and written next to it as <stem>.npy (float64
+weights, then scaler mean and scale) plus <stem>.json (format, kind, classes,
+intercept, Platt calibration, feature order, sha256 of the .sav and the
+sklearn version that read it). The export is checked to score a random
+matrix exactly like the estimator before it is kept.
+
+    python -m app.export_models [--model-dir DIR] [DIAB HEART PARK]
+
+Only this tool needs scikit-learn; the API then loads the exported files
+without it.
+"""
+import argparse
+import os
+import pickle
+import sys
+
+import numpy as np
+
+from app.model_registry import file_checksum
+from app.scoring import LinearModel, compile_model, load_linear_model, save_linear_model, score_matrix
+
+PARITY_ROWS = 1000
+
+
+def _check_parity(estimator, stem: str, n_features: int) -> None:
+    exported, _ = load_linear_model(stem)
+    x = np.random.default_rng(0).normal(0.0, 50.0, size=(PARITY_ROWS, n_features))
+    expected_labels, expected_probas = score_matrix(estimator, x)
+    labels, probas = score_matrix(exported, x)
+    if not (np.array_equal(labels, expected_labels) and np.array_equal(probas, expected_probas)):
+        raise ValueError(f"{stem}: exported model does not reproduce the estimator's scores")
+
+
+def export_model(registry, name: str) -> dict:
+    import sklearn
+
+    path = registry.path(name)
+    with open(path, "rb") as f:
+        estimator = pickle.load(f)
+    model = compile_model(estimator)
+    if not isinstance(model, LinearModel):
+        raise ValueError(f"{name}: {type(estimator).__name__} is not a supported linear model")
+
+    feature_order = registry.feature_order(name)
+    stem = registry.exported_stem(name)
+    checksum = file_checksum(path)
+    save_linear_model(
+        model,
+        stem,
+        name=name,
+        source=os.path.basename(path),
+        sha256=checksum,
+        feature_order=feature_order,
+        sklearn_version=sklearn.__version__,
+    )
+    try:
+        _check_parity(estimator, stem, len(feature_order))
+    except ValueError:
+        for suffix in (".npy", ".json"):
+            os.remove(stem + suffix)
+        raise
+    return {"name": name, "stem": stem, "kind": model.kind, "version": checksum[:12]}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("names", nargs="*", help="disease codes to export (default: all)")
+    parser.add_argument("--model-dir", help="directory with the .sav files (default: MODEL_DIR)")
+    args = parser.parse_args(argv)
+    if args.model_dir:
+        os.environ["MODEL_DIR"] = args.model_dir
+
+    from app.model_predict import model_registry
+
+    failed = False
+    for name in args.names or model_registry.names():
+        try:
+            result = export_model(model_registry, name)
+        except (OSError, ValueError, KeyError) as exc:
+            print(f"{name}: {exc}", file=sys.stderr)
+            failed = True
+            continue
+        print(f"{result['name']}: {result['kind']} {result['version']} -> {result['stem']}.json/.npy")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
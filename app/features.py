@@ -0,0 +1,186 @@
+"""Feature order, accepted ranges and vectorization of each model's input.
+
+Each FeatureSpec turns a payload into the float64 row the model scores, in
+a single pass over the model's feature order and straight into an array
+allocated once at its final size. Values outside the accepted ranges (or
+NaN) are rejected before any scoring: by Pydantic for typed payloads, with
+one vectorized comparison for matrices.
+"""
+from typing import Annotated, Dict, List, Optional, Sequence, Tuple, Type
+
+import numpy as np
+from pydantic import BaseModel, Field, create_model
+
+# Accepted (min, max) per feature, in the order the models were trained on.
+# The bounds reject impossible values; they are deliberately wider than the
+# training data.
+DIABETES_FEATURES: Dict[str, Tuple[float, float]] = {
+    "Pregnancies": (0, 20),
+    "Glucose": (0, 300),
+    "BloodPressure": (0, 200),
+    "SkinThickness": (0, 100),
+    "Insulin": (0, 1000),
+    "BMI": (0, 80),
+    "DiabetesPedigreeFunction": (0, 3),
+    "Age": (0, 120),
+}
+
+HEART_FEATURES: Dict[str, Tuple[float, float]] = {
+    "age": (0, 120),
+    "sex": (0, 1),
+    "cp": (0, 3),
+    "trestbps": (50, 250),
+    "chol": (50, 700),
+    "fbs": (0, 1),
+    "restecg": (0, 2),
+    "thalach": (50, 250),
+    "exang": (0, 1),
+    "oldpeak": (-5, 10),
+    "slope": (0, 2),
+    "ca": (0, 4),
+    "thal": (0, 3),
+}
+
+PARK_FEATURES: Dict[str, Tuple[float, float]] = {
+    "fo": (50, 300),
+    "fhi": (50, 600),
+    "flo": (50, 300),
+    "jitter_percent": (0, 1),
+    "jitter_abs": (0, 0.01),
+    "RAP": (0, 1),
+    "PPQ": (0, 1),
+    "DDP": (0, 1),
+    "shimmer": (0, 1),
+    "shimmer_dB": (0, 5),
+    "APQ3": (0, 1),
+    "APQ5": (0, 1),
+    "APQ": (0, 1),
+    "DDA": (0, 1),
+    "NHR": (0, 1),
+    "HNR": (0, 50),
+    "RPDE": (0, 1),
+    "DFA": (0, 1),
+    "spread1": (-10, 0),
+    "spread2": (0, 1),
+    "D2": (0, 5),
+    "PPE": (0, 1),
+}
+
+
+class FeatureSpec:
+    """Ordered, range-checked input of one model.
+
+    `model` is a Pydantic model generated from the ranges (one float field per
+    feature, with ge/le) and `values` the matching fixed-length tuple type for
+    the compact "x" payload; both are validated and range-checked by Pydantic
+    and documented in the OpenAPI schema.
+    """
+
+    def __init__(self, name: str, ranges: Dict[str, Tuple[float, float]]):
+        self.name = name
+        self.ranges = dict(ranges)
+        self.order: List[str] = list(ranges)
+        self.n_features = len(self.order)
+        self.low = np.array([low for low, _ in ranges.values()], dtype=np.float64)
+        self.high = np.array([high for _, high in ranges.values()], dtype=np.float64)
+        self.model = create_model(
+            f"{name}Features",
+            **{f: (float, Field(..., ge=low, le=high)) for f, (low, high) in ranges.items()},
+        )
+        self.values = Tuple[
+            tuple(Annotated[float, Field(ge=low, le=high, title=f)] for f, (low, high) in ranges.items())
+        ]
+
+    def from_model(self, features: BaseModel, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Row from an instance of `model`, already type- and range-checked by Pydantic."""
+        # fields are declared in feature order, so the instance dict is the row
+        values = features.__dict__.values()
+        if out is None:
+            return np.fromiter(values, np.float64, self.n_features)
+        out[:] = tuple(values)
+        return out
+
+    def from_values(
+        self, values: Sequence[float], out: Optional[np.ndarray] = None, check: bool = True
+    ) -> np.ndarray:
+        """Row from untyped values already in feature order; check as in from_dict."""
+        if len(values) != self.n_features:
+            raise ValueError(f"Expected {self.n_features} values, got {len(values)}")
+        if out is None:
+            out = np.empty(self.n_features)
+        try:
+            out[:] = values
+        except (TypeError, ValueError):
+            raise ValueError("Non-numeric values in x") from None
+        if check:
+            self.check(out)
+        return out
+
+    def from_dict(self, features: dict, out: Optional[np.ndarray] = None, check: bool = True) -> np.ndarray:
+        """Row from an untyped {name: value} dict, reporting every missing or non-numeric feature.
+
+        With check=False the range check is left to the caller, e.g. one
+        out_of_range() call for a whole matrix.
+        """
+        if out is None:
+            out = np.empty(self.n_features)
+        try:
+            out[:] = [features[f] for f in self.order]
+        except KeyError:
+            missing = [f for f in self.order if f not in features]
+            raise ValueError(f"Missing required features: {', '.join(missing)}") from None
+        except (TypeError, ValueError):
+            invalid = [f for f in self.order if not _is_number(features[f])]
+            raise ValueError(f"Non-numeric features: {', '.join(invalid)}") from None
+        if check:
+            self.check(out)
+        return out
+
+    def out_of_range(self, x: np.ndarray) -> np.ndarray:
+        """Boolean mask of the rows of x with a value outside its range (NaN included)."""
+        return ~((x >= self.low) & (x <= self.high)).all(axis=-1)
+
+    def check(self, row: np.ndarray) -> None:
+        """Raise ValueError naming the features of row outside their range."""
+        if self.out_of_range(row):
+            raise ValueError(self.range_error(row))
+
+    def range_error(self, row: np.ndarray) -> str:
+        in_range = (row >= self.low) & (row <= self.high)
+        names = [
+            f"{self.order[i]} ({self.low[i]:g}..{self.high[i]:g})" for i in np.flatnonzero(~in_range)
+        ]
+        return f"Features out of range: {', '.join(names)}"
+
+
+def union_model(name: str, specs: Sequence[FeatureSpec]) -> Type[BaseModel]:
+    """Pydantic model with the features of every spec as optional, range-checked floats."""
+    ranges: Dict[str, Tuple[float, float]] = {}
+    for spec in specs:
+        for f, bounds in spec.ranges.items():
+            if ranges.setdefault(f, bounds) != bounds:
+                raise ValueError(f"Feature {f} has different ranges in {name}")
+    return create_model(
+        name, **{f: (Optional[float], Field(None, ge=low, le=high)) for f, (low, high) in ranges.items()}
+    )
+
+
+def _is_number(value) -> bool:
+    try:
+        float(value)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+DIABETES = FeatureSpec("Diabetes", DIABETES_FEATURES)
+HEART = FeatureSpec("Heart", HEART_FEATURES)
+PARKINSON = FeatureSpec("Parkinson", PARK_FEATURES)
+
+# Feature orders used for inference
+DIABETES_FEATURE_ORDER = DIABETES.order
+HEART_FEATURE_ORDER = HEART.order
+PARK_FEATURE_ORDER = PARKINSON.order
+
+# Every model's input by disease code
+SPECS = {"DIAB": DIABETES, "HEART": HEART, "PARK": PARKINSON}
@@ -0,0 +1,346 @@
+"""Model scoring in a pool of worker processes.
+
+With INFERENCE_BACKEND=process the API scores outside its own interpreter,
+so inference no longer competes for the GIL with JSON parsing, validation and
+the ORM. Each pool process loads the models once, through its own
+ModelRegistry (memory-mapped exports, so the pages are shared), and owns a
+shared-memory slot: the caller writes the input matrix into the slot, sends
+(model, version, rows, features) over a pipe and reads labels and
+probabilities back from the same slot. No array or dict is ever pickled.
+
+The checksum sent with every call is that of the version the API process
+resolved, so a hot reload (ModelRegistry.reload) reaches the pool on the first
+call that needs it: a process holding another version reloads that model
+before scoring. A process may also be ahead of the API: one respawned after the
+model file changed loads the new file while the API still serves the old
+version. It then loads the requested version from its compiled artifact
+(ModelRegistry.load_version), and if that is gone too the API scores the call
+itself. Either way a call never gets scores from a version other than the one
+it reports.
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import List, Tuple
+
+import numpy as np
+
+from app.model_registry import ModelEntry, ModelRegistry
+from app.scoring import score_matrix
+
+logger = logging.getLogger(__name__)
+
+# model_dir, cache_dir, compile, [(name, filename, feature_order)]
+RegistrySpec = Tuple[str, str, bool, List[Tuple[str, str, List[str]]]]
+
+
+def _slot_views(buf, capacity: int, n_features: int):
+    """Input, label and probability arrays laid out in one shared buffer."""
+    inputs = np.ndarray((capacity * n_features,), np.float64, buffer=buf)
+    offset = inputs.nbytes
+    labels = np.ndarray((capacity,), np.int64, buffer=buf, offset=offset)
+    probas = np.ndarray((capacity,), np.float64, buffer=buf, offset=offset + labels.nbytes)
+    return inputs, labels, probas
+
+
+def _slot_size(capacity: int, n_features: int) -> int:
+    return capacity * (n_features + 2) * 8
+
+
+def _resolve(registry: ModelRegistry, pinned: dict, name: str, checksum: str):
+    """Scorer of the version of `name` with this checksum, or None if this process cannot load it."""
+    entry = registry.get(name)
+    if entry.checksum == checksum:
+        return entry.scorer
+    scorer = pinned.get((name, checksum))
+    if scorer is not None:
+        return scorer
+    # usually the API reloaded the model: the file now holds the requested version
+    registry.reload([name])
+    entry = registry.get(name)
+    if entry.checksum == checksum:
+        return entry.scorer
+    # or this process is the newer one: it was respawned after the file changed
+    entry = registry.load_version(name, checksum)
+    if entry is None:
+        return None
+    # one version kept per model, the one the API is still on
+    for key in [key for key in pinned if key[0] == name]:
+        del pinned[key]
+    pinned[(name, checksum)] = entry.scorer
+    return entry.scorer
+
+
+def _serve(conn, shm_name: str, capacity: int, n_features: int, spec: RegistrySpec) -> None:
+    """Pool process: load every model once, then score the slot on each request."""
+    # Ctrl-C reaches the whole process group; the pool stops when its parent closes the pipe
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    model_dir, cache_dir, compile, models = spec
+    registry = ModelRegistry(model_dir, cache_dir, compile=compile)
+    for name, filename, order in models:
+        registry.register(name, filename, order)
+    registry.load_all()
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    inputs, labels, probas = _slot_views(shm.buf, capacity, n_features)
+    conn.send(("ready", {name: registry.get(name).version for name in registry.names()}))
+    # versions other than the registry's current one that the API still asks for
+    pinned = {}
+    try:
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                return
+            if request is None:
+                return
+            name, checksum, n, k = request
+            try:
+                scorer = _resolve(registry, pinned, name, checksum)
+                if scorer is None:
+                    conn.send(("missing", None))
+                    continue
+                scored_labels, scored_probas = score_matrix(scorer, inputs[: n * k].reshape(n, k))
+                labels[:n] = scored_labels
+                probas[:n] = scored_probas
+            except Exception as exc:
+                conn.send(("error", repr(exc)))
+            else:
+                conn.send(("ok", None))
+    finally:
+        del inputs, labels, probas
+        shm.close()
+
+
+class _PoolProcess:
+    """One pool process with its pipe and shared-memory slot."""
+
+    def __init__(self, context, index: int, capacity: int, n_features: int, spec: RegistrySpec):
+        self.index = index
+        self.capacity = capacity
+        self.n_features = n_features
+        self.shm = shared_memory.SharedMemory(create=True, size=_slot_size(capacity, n_features))
+        self.inputs, self.labels, self.probas = _slot_views(self.shm.buf, capacity, n_features)
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_serve,
+            args=(child_conn, self.shm.name, capacity, n_features, spec),
+            name=f"inference-{index}",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+
+    def wait_ready(self) -> dict:
+        """Versions loaded by the process, once it is ready to score."""
+        try:
+            _, versions = self.conn.recv()
+        except EOFError:
+            self.process.join()
+            raise RuntimeError(
+                f"Inference process {self.index} exited while loading the models "
+                f"(exit code {self.process.exitcode})"
+            ) from None
+        return versions
+
+    def score(self, name: str, checksum: str, x: np.ndarray, labels: np.ndarray, probas: np.ndarray) -> bool:
+        """Score x (at most `capacity` rows) into labels and probas; False if the process lacks that version."""
+        n, k = x.shape
+        self.inputs[: n * k].reshape(n, k)[:] = x
+        self.conn.send((name, checksum, n, k))
+        status, error = self.conn.recv()
+        if status == "missing":
+            return False
+        if status != "ok":
+            raise RuntimeError(f"Inference process {self.index} failed on {name}: {error}")
+        labels[:] = self.labels[:n]
+        probas[:] = self.probas[:n]
+        return True
+
+    def close(self, timeout: float = 5.0) -> None:
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout)
+        self.conn.close()
+        del self.inputs, self.labels, self.probas
+        self.shm.close()
+        self.shm.unlink()
+
+
+class InferencePool:
+    """score(entry, x) on one of `processes` worker processes.
+
+    Processes are spawned (never forked, the API process has threads) by
+    start() or on the first call, so a server that preloads the app and then
+    forks its workers gets one pool per worker. As with any spawned process,
+    a script that starts the pool needs the `if __name__ == "__main__"` guard.
+    Each call takes an idle process for as long as it runs; matrices larger
+    than max_rows go through its slot in several rounds. A process that dies
+    is replaced and only the call it was serving fails. A call for a version
+    no pool process can load any more is scored in the calling process with
+    entry.scorer (counted as a fallback).
+    """
+
+    def __init__(self, registry: ModelRegistry, processes: int = 1, max_rows: int = 1024):
+        if processes < 1:
+            raise ValueError("processes must be at least 1")
+        if max_rows < 1:
+            raise ValueError("max_rows must be at least 1")
+        self.processes = processes
+        self.max_rows = max_rows
+        self._spec: RegistrySpec = (
+            registry.model_dir,
+            registry.cache_dir,
+            registry.compile,
+            [
+                (name, os.path.basename(registry.path(name)), registry.feature_order(name))
+                for name in registry.names()
+            ],
+        )
+        self._n_features = max(len(order) for _, _, order in self._spec[3])
+        self._context = multiprocessing.get_context("spawn")
+
+        self._idle: "queue.Queue[_PoolProcess]" = queue.Queue()
+        self._members: List[_PoolProcess] = []
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._calls = 0
+        self._rows = 0
+        self._busy_seconds = 0.0
+        self._restarts = 0
+        self._failures = 0
+        self._fallbacks = 0
+        self._fallback_versions = set()
+
+    def start(self) -> None:
+        """Spawn the pool processes and wait until each has loaded the models."""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # a pool inherited through fork belongs to the parent: start our own
+            self._idle = queue.Queue()
+            self._members = []
+            started = time.perf_counter()
+            try:
+                for index in range(self.processes):
+                    self._members.append(self._spawn(index))
+                for member in self._members:
+                    member.wait_ready()
+                    self._idle.put(member)
+            except BaseException:
+                for member in self._members:
+                    member.close(timeout=1.0)
+                self._members = []
+                raise
+            self._pid = os.getpid()
+            atexit.register(self.close)
+            logger.info(
+                "Inference pool: %d processes ready in %.2f s", self.processes, time.perf_counter() - started
+            )
+
+    def close(self) -> None:
+        """Stop the pool processes and free their shared memory."""
+        with self._start_lock:
+            if self._pid != os.getpid():
+                return
+            self._pid = None
+            members, self._members = self._members, []
+        for member in members:
+            member.close()
+
+    def score(self, entry: ModelEntry, x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Labels and probabilities of every row of x, scored by the model version of entry."""
+        self.start()
+        x = np.asarray(x, dtype=np.float64)
+        n = x.shape[0]
+        labels = np.empty(n, dtype=np.int64)
+        probas = np.empty(n, dtype=np.float64)
+        member = self._idle.get()
+        started = time.perf_counter()
+        scored = True
+        try:
+            for start in range(0, n, self.max_rows):
+                stop = min(start + self.max_rows, n)
+                scored = member.score(
+                    entry.name, entry.checksum, x[start:stop], labels[start:stop], probas[start:stop]
+                )
+                if not scored:
+                    break
+        except (EOFError, OSError) as exc:
+            member = self._replace(member)
+            raise RuntimeError(f"Inference process died while scoring {entry.name}: {exc!r}") from exc
+        except RuntimeError:
+            with self._stats_lock:
+                self._failures += 1
+            raise
+        finally:
+            self._idle.put(member)
+        if not scored:
+            return self._score_here(entry, x)
+        with self._stats_lock:
+            self._calls += 1
+            self._rows += n
+            self._busy_seconds += time.perf_counter() - started
+        return labels, probas
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            calls, rows, busy = self._calls, self._rows, self._busy_seconds
+            restarts, failures, fallbacks = self._restarts, self._failures, self._fallbacks
+        return {
+            "processes": self.processes,
+            "started": self._pid == os.getpid(),
+            "idle": self._idle.qsize(),
+            "max_rows": self.max_rows,
+            "calls": calls,
+            "rows": rows,
+            "avg_call_ms": busy / calls * 1000.0 if calls else 0.0,
+            "restarts": restarts,
+            "failures": failures,
+            "fallbacks": fallbacks,
+        }
+
+    def _score_here(self, entry: ModelEntry, x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        with self._stats_lock:
+            self._fallbacks += 1
+            first = (entry.name, entry.checksum) not in self._fallback_versions
+            self._fallback_versions.add((entry.name, entry.checksum))
+        if first:
+            logger.warning(
+                "No inference process can load %s version %s any more; scoring it in the API process "
+                "until the model is reloaded",
+                entry.name, entry.version,
+            )
+        return score_matrix(entry.scorer, x)
+
+    def _spawn(self, index: int) -> _PoolProcess:
+        return _PoolProcess(self._context, index, self.max_rows, self._n_features, self._spec)
+
+    def _replace(self, member: _PoolProcess) -> _PoolProcess:
+        logger.error(
+            "Inference process %d died (exit code %s), restarting it", member.index, member.process.exitcode
+        )
+        member.close(timeout=1.0)
+        replacement = self._spawn(member.index)
+        replacement.wait_ready()
+        with self._start_lock:
+            self._members = [replacement if m is member else m for m in self._members]
+        with self._stats_lock:
+            self._restarts += 1
+            self._failures += 1
+        return replacement
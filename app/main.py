@@ -1,29 +1,155 @@
+import asyncio
+import csv
+import io
+import json
 import os
-from typing import Optional
-
-from fastapi import Depends, FastAPI, HTTPException
+import secrets
+import signal
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import ClassVar, Dict, List, Literal, Optional
+
+from fastapi import Depends, FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi.responses import Response, StreamingResponse
+import numpy as np
+from pydantic import BaseModel, Field, PrivateAttr, ValidationError, model_validator
+from sqlalchemy.exc import DisconnectionError, InterfaceError, OperationalError
+from sqlalchemy.exc import TimeoutError as SQLAlchemyTimeoutError
 from sqlalchemy.orm import Session
-
-from app.utils.database import SessionLocal, Base, engine
+from starlette.concurrency import run_in_threadpool
+
+from app import metrics
+from app.utils.database import (
+    DB_ASYNC,
+    SQLITE_SINGLE_WRITER,
+    SQLITE_WRITER_MAX_BATCH,
+    AsyncSessionLocal,
+    SessionLocal,
+    Base,
+    async_engine,
+    engine,
+    run_db,
+)
 from app.utils import crud
+from app.utils.migrations import run_migrations
+from app.utils.journal import WriteBehindJournal
+from app.utils.pool import pool_stats
+from app.utils.writer import SingleWriter
+from app.features import DIABETES, HEART, PARKINSON, SPECS, FeatureSpec, union_model
 from app.model_predict import (
-    DIABETES_FEATURE_ORDER,
-    HEART_FEATURE_ORDER,
-    PARK_FEATURE_ORDER,
-    predict_diabetes,
-    predict_heart,
-    predict_parkinson,
+    MICROBATCH_ENABLED,
+    diagnosis_message,
+    batching_stats,
+    inference_pool,
+    inference_stats,
+    model_registry,
+    prediction_cache_stats,
+    predict_matrix,
+    predict_row,
+    predict_rows,
+    reload_models,
+    submit_row,
 )
 from app.models import Disease
-from app.utils.validators import validate_required_features
 
-# Create tables if they don't exist
+# Create tables if they don't exist, then bring older databases up to date
 Base.metadata.create_all(bind=engine)
+run_migrations(engine)
 
 app = FastAPI(title="MedDiag API", version="1.0.0")
 
+# Every route declared below is counted and timed stage by stage (see app/metrics.py)
+if metrics.METRICS_ENABLED:
+    app.router.route_class = metrics.MetricsRoute
+    metrics.instrument_engine(engine)
+    if async_engine is not None:
+        metrics.instrument_engine(async_engine.sync_engine)
+
+# Upper bound on the number of patients accepted by a single batch request
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+
+# On SQLite every diagnosis write goes through one writer thread that commits
+# all concurrently queued writes in a single transaction
+diagnosis_writer = (
+    SingleWriter("diagnoses", SessionLocal, max_batch_size=SQLITE_WRITER_MAX_BATCH)
+    if SQLITE_SINGLE_WRITER
+    else None
+)
+
+# WRITE_BEHIND=1 answers a prediction as soon as its diagnosis is stored in a
+# local durable journal; a background thread writes the journal to the
+# database in batches and replays whatever is left after a crash
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "0") == "1"
+# Defaults to the per-user state dir ($XDG_STATE_HOME/meddiag), never the source tree
+WRITE_BEHIND_JOURNAL = os.getenv("WRITE_BEHIND_JOURNAL") or os.path.join(
+    os.getenv("XDG_STATE_HOME") or os.path.join(os.path.expanduser("~"), ".local", "state"),
+    "meddiag",
+    "write-behind.db",
+)
+WRITE_BEHIND_BATCH = int(os.getenv("WRITE_BEHIND_BATCH", "500"))
+WRITE_BEHIND_INTERVAL_MS = int(os.getenv("WRITE_BEHIND_INTERVAL_MS", "200"))
+# FULL: an acknowledged prediction survives a power loss; NORMAL is faster
+# but may lose the last appends
+WRITE_BEHIND_SYNCHRONOUS = os.getenv("WRITE_BEHIND_SYNCHRONOUS", "FULL")
+# The database is down, busy or dropped the connection: retry the batch
+# later. Any other error dead-letters the records that cause it.
+WRITE_BEHIND_RETRYABLE = (OperationalError, InterfaceError, DisconnectionError, SQLAlchemyTimeoutError)
+
+
+def _apply_journal_batch(records: List[dict]) -> None:
+    with SessionLocal() as db:
+        crud.create_diagnoses_from_records(db, records)
+        db.commit()
+
+
+write_behind = (
+    WriteBehindJournal(
+        WRITE_BEHIND_JOURNAL,
+        _apply_journal_batch,
+        batch_size=WRITE_BEHIND_BATCH,
+        interval_ms=WRITE_BEHIND_INTERVAL_MS,
+        synchronous=WRITE_BEHIND_SYNCHRONOUS,
+        retryable=WRITE_BEHIND_RETRYABLE,
+    )
+    if WRITE_BEHIND
+    else None
+)
+
+# Shared secret for the /admin endpoints, sent in the X-Admin-Token header;
+# when unset those endpoints answer 404
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Rows fetched from the database and written to the response per export chunk
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_FIELDS = [
+    "id",
+    "generated_at",
+    "status",
+    "final_description",
+    "user_name",
+    "user_email",
+    "disease_name",
+    "disease_code",
+    "probability",
+    "model_version",
+]
+
+# In async mode model scoring runs on its own executor, away from the event loop
+# and from the threadpool used by the rest of the app (with micro-batching,
+# single rows are scored by the batcher threads instead, see score_row)
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(min(8, os.cpu_count() or 1))))
+
+
+def _new_inference_executor() -> Optional[ThreadPoolExecutor]:
+    return ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference") if DB_ASYNC else None
+
+
+inference_executor = _new_inference_executor()
+
 allowed_origins = os.getenv("ALLOWED_ORIGINS", "*")
 origins = [o.strip() for o in allowed_origins.split(",")]
 
@@ -43,19 +169,48 @@ class Patient(BaseModel):
     phone_number: Optional[str] = Field(None, example="+57 3000000000")
 
 
-class DiabetesRequest(BaseModel):
-    patient: Patient
-    features: dict
+class PredictionRequest(BaseModel):
+    """A patient plus either typed `features` or `x`, the values in the model's feature order.
 
+    Both forms are type- and range-checked by Pydantic while the body is
+    parsed; row() then builds the float64 array that gets scored.
+    """
 
-class HeartRequest(BaseModel):
+    spec: ClassVar[FeatureSpec]
     patient: Patient
-    features: dict
 
+    @model_validator(mode="after")
+    def _one_form(self):
+        if (self.features is None) == (self.x is None):
+            raise ValueError("Provide either features or x")
+        return self
 
-class ParkinsonRequest(BaseModel):
-    patient: Patient
-    features: dict
+    def row(self) -> np.ndarray:
+        if self.x is not None:
+            return np.array(self.x)
+        return self.spec.from_model(self.features)
+
+
+def _values_field(spec: FeatureSpec):
+    return Field(None, description=f"Values in this order, instead of features: {', '.join(spec.order)}")
+
+
+class DiabetesRequest(PredictionRequest):
+    spec: ClassVar[FeatureSpec] = DIABETES
+    features: Optional[DIABETES.model] = None
+    x: Optional[DIABETES.values] = _values_field(DIABETES)
+
+
+class HeartRequest(PredictionRequest):
+    spec: ClassVar[FeatureSpec] = HEART
+    features: Optional[HEART.model] = None
+    x: Optional[HEART.values] = _values_field(HEART)
+
+
+class ParkinsonRequest(PredictionRequest):
+    spec: ClassVar[FeatureSpec] = PARKINSON
+    features: Optional[PARKINSON.model] = None
+    x: Optional[PARKINSON.values] = _values_field(PARKINSON)
 
 
 class DiagnosisResponse(BaseModel):
@@ -65,7 +220,80 @@ class DiagnosisResponse(BaseModel):
     message: str
 
 
-def get_db():
+PanelFeatures = union_model("PanelFeatures", list(SPECS.values()))
+
+
+class PanelRequest(BaseModel):
+    """A patient plus the union of the features of several models.
+
+    Every model whose features are all given is scored, or only the models in
+    `diseases`, whose features must then be complete. A model with only some
+    of its features given is rejected rather than silently skipped.
+    """
+
+    patient: Patient
+    features: PanelFeatures
+    diseases: Optional[List[Literal[tuple(SPECS)]]] = Field(None, min_length=1, example=["DIAB", "HEART"])
+    _rows: Dict[str, np.ndarray] = PrivateAttr()
+
+    @model_validator(mode="after")
+    def _select_models(self):
+        given = self.features.model_dump(exclude_none=True)
+        rows = {}
+        for code, spec in SPECS.items():
+            if self.diseases is not None and code not in self.diseases:
+                continue
+            missing = [f for f in spec.order if f not in given]
+            if not missing:
+                rows[code] = np.fromiter((given[f] for f in spec.order), np.float64, spec.n_features)
+            elif self.diseases is not None or len(missing) < spec.n_features:
+                raise ValueError(f"Missing features for {code}: {', '.join(missing)}")
+        if not rows:
+            raise ValueError("No model has all its features in the panel")
+        self._rows = rows
+        return self
+
+    def rows(self) -> Dict[str, np.ndarray]:
+        return self._rows
+
+
+class PanelResponse(BaseModel):
+    results: List[DiagnosisResponse]
+
+
+class BatchItem(BaseModel):
+    """One patient of a batch; like PredictionRequest, but rows, patient included,
+    are checked one by one so that an invalid row is reported in `errors`
+    instead of failing the batch."""
+
+    patient: dict
+    features: Optional[dict] = None
+    x: Optional[list] = Field(None, description="Values in the model's feature order, instead of features")
+
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+
+
+class BatchRowResult(BaseModel):
+    index: int
+    disease_code: str
+    prediction: int
+    probability: float
+    message: str
+
+
+class BatchRowError(BaseModel):
+    index: int
+    error: str
+
+
+class BatchDiagnosisResponse(BaseModel):
+    results: List[BatchRowResult]
+    errors: List[BatchRowError]
+
+
+def _get_sync_db():
     db = SessionLocal()
     try:
         yield db
@@ -73,10 +301,85 @@ def get_db():
         db.close()
 
 
+async def _get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+get_db = _get_async_db if DB_ASYNC else _get_sync_db
+
+
+async def run_inference(fn, *args):
+    """Run a scoring function off the event loop (dedicated executor in async mode)."""
+    if inference_executor is not None:
+        return await asyncio.get_running_loop().run_in_executor(inference_executor, fn, *args)
+    return await run_in_threadpool(fn, *args)
+
+
+async def score_row(disease_code: str, row: np.ndarray):
+    """predict_row for an async endpoint: (label, probability, model_version)."""
+    if MICROBATCH_ENABLED:
+        # wait for the batch on the event loop: a thread blocked per pending row
+        # would cap every batch at the size of the executor (1 on a 1-CPU host)
+        return await asyncio.wrap_future(submit_row(disease_code, row))
+    return await run_inference(predict_row, disease_code, row)
+
+
 @app.on_event("startup")
 def startup_seed():
     with SessionLocal() as db:
         crud.seed_default_diseases(db)
+    if diagnosis_writer is not None:
+        diagnosis_writer.start()
+    if write_behind is not None:
+        write_behind.start()
+    if inference_pool is not None:
+        inference_pool.start()
+
+
+def after_fork() -> None:
+    """Drop what a worker inherited from a server that imported the app before forking.
+
+    The connections opened at import (create_all, migrations, the write-behind
+    journal) belong to the parent and must not be used by several processes;
+    gunicorn.conf.py calls this in every worker when the app is preloaded.
+    """
+    engine.dispose(close=False)
+    if async_engine is not None:
+        async_engine.sync_engine.dispose(close=False)
+    if write_behind is not None:
+        write_behind.reopen()
+
+
+def _reload_on_signal(signum, frame):
+    # signal handlers run on the main thread, between bytecodes of the event loop
+    threading.Thread(target=reload_models, name="model-reload", daemon=True).start()
+
+
+@app.on_event("startup")
+def install_reload_signal():
+    """kill -HUP <worker pid> reloads the changed model files of that worker."""
+    if not hasattr(signal, "SIGHUP"):
+        return
+    try:
+        signal.signal(signal.SIGHUP, _reload_on_signal)
+    except ValueError:  # not on the main thread (e.g. TestClient)
+        pass
+
+
+@app.on_event("shutdown")
+def shutdown_executor():
+    global inference_executor
+    if inference_executor is not None:
+        inference_executor.shutdown(wait=False)
+        # threads start on first use, so this costs nothing and a later startup can score again
+        inference_executor = _new_inference_executor()
+    if diagnosis_writer is not None:
+        diagnosis_writer.close()
+    if write_behind is not None:
+        write_behind.close()
+    if inference_pool is not None:
+        inference_pool.close()
 
 
 @app.get("/health")
@@ -84,8 +387,75 @@ def health():
     return {"status": "ok"}
 
 
-@app.post("/users")
-def create_user(patient: Patient, db: Session = Depends(get_db)):
+@app.get("/metrics")
+def metrics_prometheus():
+    """Request, stage and per-model counters in the Prometheus text format."""
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/metrics/batching")
+def metrics_batching():
+    return {"enabled": MICROBATCH_ENABLED, "models": batching_stats()}
+
+
+@app.get("/metrics/prediction-cache")
+def metrics_prediction_cache():
+    return prediction_cache_stats()
+
+
+@app.get("/metrics/writer")
+def metrics_writer():
+    return {"enabled": diagnosis_writer is not None, "writer": diagnosis_writer.stats() if diagnosis_writer else None}
+
+
+@app.get("/metrics/write-behind")
+def metrics_write_behind():
+    return {"enabled": write_behind is not None, "journal": write_behind.stats() if write_behind else None}
+
+
+@app.get("/metrics/inference")
+def metrics_inference():
+    return inference_stats()
+
+
+@app.get("/metrics/pool")
+def metrics_pool():
+    pools = {"sync": pool_stats(engine)}
+    if async_engine is not None:
+        pools["async"] = pool_stats(async_engine.sync_engine)
+    return pools
+
+
+@app.get("/models")
+def list_models():
+    return model_registry.info()
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@app.post("/admin/models/reload", dependencies=[Depends(require_admin)])
+async def admin_reload_models(model: Optional[str] = None):
+    """Load, validate and swap in the changed model files of this worker.
+
+    Requests already scoring keep the model they started with. A model whose
+    new file fails to load or validate keeps its current version (422).
+    """
+    if model is not None and model not in model_registry.names():
+        raise HTTPException(status_code=404, detail=f"Unknown model: {model}")
+    results = await run_in_threadpool(reload_models, [model] if model else None)
+    if any("error" in result for result in results.values()):
+        raise HTTPException(status_code=422, detail=results)
+    return results
+
+
+def _create_user(db: Session, patient: Patient) -> dict:
     user = crud.get_or_create_user(
         db,
         name=patient.name,
@@ -97,69 +467,205 @@ def create_user(patient: Patient, db: Session = Depends(get_db)):
     return {"id": user.id, "name": user.name, "email": user.email}
 
 
-@app.get("/diagnoses/history")
-def diagnoses_history(
+@app.post("/users")
+async def create_user(patient: Patient, db: Session = Depends(get_db)):
+    return await run_db(db, _create_user, patient)
+
+
+def _history_item(r) -> dict:
+    return {
+        "id": r.id,
+        "generated_at": r.generated_at,
+        "status": r.status,
+        "final_description": r.final_description,
+        "user_name": r.user_name,
+        "user_email": r.user_email,
+        "disease_name": r.disease_name,
+        "disease_code": r.disease_code,
+        "probability": float(r.probability),
+        "model_version": r.model_version,
+    }
+
+
+def history_filters(
     name: Optional[str] = None,
     email: Optional[str] = None,
+    disease_code: Optional[str] = None,
+    status: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+) -> dict:
+    """Query filters shared by /diagnoses/history and /diagnoses/export; all optional and combined."""
+    if date_from and date_to and date_from >= date_to:
+        raise HTTPException(status_code=400, detail="date_from must be earlier than date_to")
+    return {
+        "name": name,
+        "email": email,
+        "disease_code": disease_code,
+        "status": status,
+        "date_from": date_from,
+        "date_to": date_to,
+    }
+
+
+def _history_page(db: Session, filters: dict, limit: int, cursor: Optional[str]) -> dict:
+    rows = crud.get_diagnosis_history(db, limit, cursor, **filters)
+    items = [_history_item(r) for r in rows]
+    return {"items": items, "next_cursor": crud.next_cursor(rows, limit)}
+
+
+@app.get("/diagnoses/history")
+async def diagnoses_history(
     limit: int = 50,
+    cursor: Optional[str] = None,
+    filters: dict = Depends(history_filters),
     db: Session = Depends(get_db),
 ):
     if limit <= 0 or limit > 500:
         raise HTTPException(status_code=400, detail="Limit must be between 1 and 500")
 
-    if name:
-        rows = crud.get_diagnoses_by_user_name(db, name, limit)
-    elif email:
-        rows = crud.get_diagnoses_by_user_email(db, email, limit)
-    else:
-        rows = crud.get_recent_diagnoses(db, limit)
-
-    return [
-        {
-            "id": r.id,
-            "generated_at": r.generated_at,
-            "status": r.status,
-            "final_description": r.final_description,
-            "user_name": r.user_name,
-            "user_email": r.user_email,
-            "disease_name": r.disease_name,
-            "disease_code": r.disease_code,
-            "probability": float(r.probability),
-        }
-        for r in rows
-    ]
+    try:
+        return await run_db(db, _history_page, filters, limit, cursor)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+def _export_chunks(export_format: str, filters: dict):
+    """Serialize the export EXPORT_BATCH_SIZE rows per chunk.
+
+    Runs after the endpoint has returned, when the request's dependencies are
+    already closed, so it opens its own session for the lifetime of the stream.
+    """
+    with SessionLocal() as db:
+        rows = crud.iter_diagnoses(db, batch_size=EXPORT_BATCH_SIZE, **filters)
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+        if export_format == "csv":
+            writer.writeheader()
+        pending = 0
+        for r in rows:
+            item = _history_item(r)
+            item["generated_at"] = item["generated_at"].isoformat()
+            if export_format == "csv":
+                writer.writerow(item)
+            else:
+                buffer.write(json.dumps(item, ensure_ascii=False))
+                buffer.write("\n")
+            pending += 1
+            if pending == EXPORT_BATCH_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+        if buffer.tell():
+            yield buffer.getvalue()
+
+
+@app.get("/diagnoses/export")
+def diagnoses_export(format: str = "ndjson", filters: dict = Depends(history_filters)):
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Format must be one of: ndjson, csv")
+    if filters["disease_code"]:
+        # Fail before the stream starts; the registry answers without a query once loaded
+        with SessionLocal() as db:
+            try:
+                crud.disease_registry.get_id(db, filters["disease_code"])
+            except ValueError as exc:
+                raise HTTPException(status_code=400, detail=str(exc))
+
+    return StreamingResponse(
+        _export_chunks(format, filters),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="diagnoses.{format}"'},
+    )
+
+
+def _commit_write(db: Session, fn, *args):
+    result = fn(db, *args)
+    db.commit()
+    return result
 
 
-def _save_and_response(
+async def _write(db: Session, fn, *args):
+    """Run fn(session, *args) and commit it, through the SQLite writer when enabled.
+
+    fn must not commit; with the writer it shares its transaction with other
+    requests' writes and the request's own session is left untouched.
+    """
+    if diagnosis_writer is not None:
+        # the writer's statements and group commit are timed as background work
+        with metrics.timed("db_write"):
+            return await asyncio.wrap_future(diagnosis_writer.submit(fn, *args))
+    return await run_db(db, _commit_write, fn, *args)
+
+
+async def _append_journal(records: List[dict]) -> None:
+    with metrics.timed("db_write"):
+        await run_in_threadpool(write_behind.append, records)
+
+
+def _journal_record(
+    patient: Patient, disease_code: str, probability: float, message: str, model_version: str
+) -> dict:
+    return {
+        "external_ref": uuid.uuid4().hex,
+        "patient": patient.model_dump(),
+        "disease_code": disease_code,
+        "probability": probability,
+        "final_description": message,
+        "model_version": model_version,
+    }
+
+
+def _journal_panel_record(patient: Patient, results: list, message: str) -> dict:
+    return {
+        "external_ref": uuid.uuid4().hex,
+        "patient": patient.model_dump(),
+        "final_description": message,
+        "details": [
+            {"disease_code": code, "probability": proba, "model_version": model_version}
+            for code, proba, model_version in results
+        ],
+    }
+
+
+def _persist_diagnosis(
     db: Session,
     patient: Patient,
-    features: dict,
-    ordered_features: list,
     disease_code: str,
-    predictor,
-    positive_msg: str,
-    negative_msg: str,
-) -> DiagnosisResponse:
-    validate_required_features(features, ordered_features)
-    label, proba = predictor(features)
-    message = positive_msg if label == 1 else negative_msg
-
-    user = crud.get_or_create_user(
+    probability: float,
+    message: str,
+    model_version: str,
+) -> None:
+    crud.create_patient_diagnosis(
         db,
         name=patient.name,
         email=patient.email,
         gender=patient.gender,
         phone_number=patient.phone_number,
-    )
-
-    crud.create_diagnosis_with_single_candidate(
-        db=db,
-        user_id=user.id,
         disease_code=disease_code,
-        probability=proba,
+        probability=probability,
         final_description=message,
+        model_version=model_version,
     )
-    db.commit()
+
+
+async def _save_and_response(
+    db: Session,
+    patient: Patient,
+    row: np.ndarray,
+    disease_code: str,
+) -> DiagnosisResponse:
+    with metrics.timed("inference"):
+        label, proba, model_version = await score_row(disease_code, row)
+    metrics.count_predictions(disease_code, model_version, 1, label)
+    message = diagnosis_message(disease_code, label)
+
+    if write_behind is not None:
+        record = _journal_record(patient, disease_code, proba, message, model_version)
+        await _append_journal([record])
+    else:
+        await _write(db, _persist_diagnosis, patient, disease_code, proba, message, model_version)
 
     return DiagnosisResponse(
         disease_code=disease_code,
@@ -170,42 +676,206 @@ def _save_and_response(
 
 
 @app.post("/predict/diabetes", response_model=DiagnosisResponse)
-def predict_diabetes_endpoint(payload: DiabetesRequest, db: Session = Depends(get_db)):
-    return _save_and_response(
+async def predict_diabetes_endpoint(payload: DiabetesRequest, db: Session = Depends(get_db)):
+    return await _save_and_response(
         db=db,
         patient=payload.patient,
-        features=payload.features,
-        ordered_features=DIABETES_FEATURE_ORDER,
+        row=payload.row(),
         disease_code="DIAB",
-        predictor=predict_diabetes,
-        positive_msg="La persona puede ser diabética, consulte a su médico.",
-        negative_msg="La persona no es diabética.",
     )
 
 
 @app.post("/predict/heart", response_model=DiagnosisResponse)
-def predict_heart_endpoint(payload: HeartRequest, db: Session = Depends(get_db)):
-    return _save_and_response(
+async def predict_heart_endpoint(payload: HeartRequest, db: Session = Depends(get_db)):
+    return await _save_and_response(
         db=db,
         patient=payload.patient,
-        features=payload.features,
-        ordered_features=HEART_FEATURE_ORDER,
+        row=payload.row(),
         disease_code="HEART",
-        predictor=predict_heart,
-        positive_msg="La persona puede ser cardiaca, consulte a su médico.",
-        negative_msg="La persona no es cardiaca.",
     )
 
 
 @app.post("/predict/parkinson", response_model=DiagnosisResponse)
-def predict_parkinson_endpoint(payload: ParkinsonRequest, db: Session = Depends(get_db)):
-    return _save_and_response(
+async def predict_parkinson_endpoint(payload: ParkinsonRequest, db: Session = Depends(get_db)):
+    return await _save_and_response(
         db=db,
         patient=payload.patient,
-        features=payload.features,
-        ordered_features=PARK_FEATURE_ORDER,
+        row=payload.row(),
+        disease_code="PARK",
+    )
+
+
+def _persist_panel(db: Session, patient: Patient, results: list, message: str) -> None:
+    crud.create_patient_panel(
+        db,
+        name=patient.name,
+        email=patient.email,
+        gender=patient.gender,
+        phone_number=patient.phone_number,
+        results=results,
+        final_description=message,
+    )
+
+
+async def _score_panel(rows: Dict[str, np.ndarray]) -> Dict[str, tuple]:
+    """(label, probability, model_version) per disease code."""
+    if MICROBATCH_ENABLED:
+        # each row waits in its own model's batcher: let the waits overlap
+        scores = await asyncio.gather(*(score_row(code, row) for code, row in rows.items()))
+        return dict(zip(rows, scores))
+    # a handful of microsecond-scale models: one trip to the executor beats one per model
+    return await run_inference(predict_rows, rows)
+
+
+@app.post("/predict/panel", response_model=PanelResponse)
+async def predict_panel_endpoint(payload: PanelRequest, db: Session = Depends(get_db)):
+    """Screen one patient with several models; stored as one diagnosis with a detail per model."""
+    with metrics.timed("inference"):
+        scores = await _score_panel(payload.rows())
+    for code, (label, _, model_version) in scores.items():
+        metrics.count_predictions(code, model_version, 1, label)
+    messages = {code: diagnosis_message(code, label) for code, (label, _, _) in scores.items()}
+    message = " ".join(messages.values())
+    results = [(code, proba, model_version) for code, (_, proba, model_version) in scores.items()]
+
+    if write_behind is not None:
+        record = _journal_panel_record(payload.patient, results, message)
+        await _append_journal([record])
+    else:
+        await _write(db, _persist_panel, payload.patient, results, message)
+
+    return PanelResponse(
+        results=[
+            DiagnosisResponse(disease_code=code, prediction=label, probability=proba, message=messages[code])
+            for code, (label, proba, _) in scores.items()
+        ]
+    )
+
+
+def _split_batch(items: List[BatchItem], spec: FeatureSpec) -> tuple:
+    """Valid (index, patient) pairs, per-row errors and the matrix of the valid rows.
+
+    Rows are written straight into one matrix allocated for the whole batch
+    (a row that cannot be parsed is overwritten by the next one), and ranges
+    are checked once for the whole matrix.
+    """
+    valid: List[tuple] = []
+    errors: List[BatchRowError] = []
+    x = np.empty((len(items), spec.n_features))
+    for index, item in enumerate(items):
+        row = x[len(valid)]
+        try:
+            patient = Patient.model_validate(item.patient)
+        except ValidationError as exc:
+            message = "; ".join(
+                f"patient.{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in exc.errors()
+            )
+            errors.append(BatchRowError(index=index, error=message))
+            continue
+        try:
+            if (item.features is None) == (item.x is None):
+                raise ValueError("Provide either features or x")
+            if item.x is not None:
+                spec.from_values(item.x, out=row, check=False)
+            else:
+                spec.from_dict(item.features, out=row, check=False)
+        except ValueError as exc:
+            errors.append(BatchRowError(index=index, error=str(exc)))
+        else:
+            valid.append((index, patient))
+    x = x[: len(valid)]
+
+    bad = spec.out_of_range(x)
+    if bad.any():
+        for position in np.flatnonzero(bad):
+            errors.append(BatchRowError(index=valid[position][0], error=spec.range_error(x[position])))
+        errors.sort(key=lambda error: error.index)
+        valid = [pair for pair, out in zip(valid, bad) if not out]
+        x = x[~bad]
+    return valid, errors, x
+
+
+def _persist_batch(
+    db: Session,
+    valid: List[tuple],
+    disease_code: str,
+    scores: list,
+    messages: List[str],
+    model_version: str,
+) -> None:
+    users = crud.get_or_create_users(db, [patient.model_dump() for _, patient in valid])
+    crud.create_diagnoses_bulk(
+        db=db,
+        users=users,
+        disease_code=disease_code,
+        results=[(proba, message) for (_, proba), message in zip(scores, messages)],
+        model_version=model_version,
+    )
+
+
+async def _save_batch_and_response(
+    db: Session,
+    items: List[BatchItem],
+    spec: FeatureSpec,
+    disease_code: str,
+) -> BatchDiagnosisResponse:
+    with metrics.timed("validation"):
+        valid, errors, x = _split_batch(items, spec)
+    if not valid:
+        return BatchDiagnosisResponse(results=[], errors=errors)
+
+    with metrics.timed("inference"):
+        scores, model_version = await run_inference(predict_matrix, disease_code, x)
+    metrics.count_predictions(disease_code, model_version, len(scores), sum(label for label, _ in scores))
+    messages = [diagnosis_message(disease_code, label) for label, _ in scores]
+
+    if write_behind is not None:
+        records = [
+            _journal_record(patient, disease_code, proba, message, model_version)
+            for (_, patient), (_, proba), message in zip(valid, scores, messages)
+        ]
+        await _append_journal(records)
+    else:
+        await _write(db, _persist_batch, valid, disease_code, scores, messages, model_version)
+
+    results = [
+        BatchRowResult(
+            index=index,
+            disease_code=disease_code,
+            prediction=label,
+            probability=proba,
+            message=message,
+        )
+        for (index, _), (label, proba), message in zip(valid, scores, messages)
+    ]
+    return BatchDiagnosisResponse(results=results, errors=errors)
+
+
+@app.post("/predict/diabetes/batch", response_model=BatchDiagnosisResponse)
+async def predict_diabetes_batch_endpoint(payload: BatchRequest, db: Session = Depends(get_db)):
+    return await _save_batch_and_response(
+        db=db,
+        items=payload.items,
+        spec=DIABETES,
+        disease_code="DIAB",
+    )
+
+
+@app.post("/predict/heart/batch", response_model=BatchDiagnosisResponse)
+async def predict_heart_batch_endpoint(payload: BatchRequest, db: Session = Depends(get_db)):
+    return await _save_batch_and_response(
+        db=db,
+        items=payload.items,
+        spec=HEART,
+        disease_code="HEART",
+    )
+
+
+@app.post("/predict/parkinson/batch", response_model=BatchDiagnosisResponse)
+async def predict_parkinson_batch_endpoint(payload: BatchRequest, db: Session = Depends(get_db)):
+    return await _save_batch_and_response(
+        db=db,
+        items=payload.items,
+        spec=PARKINSON,
         disease_code="PARK",
-        predictor=predict_parkinson,
-        positive_msg="La persona puede tener Parkinson, consulte a su médico.",
-        negative_msg="La persona no tiene Parkinson.",
     )
@@ -0,0 +1,335 @@
+"""Request, stage and model metrics in the Prometheus text format (GET /metrics).
+
+- meddiag_requests_total{route, method, status} and
+  meddiag_request_duration_seconds{route, method}: every request handled by a
+  route, timed from the first byte of the body read to the response
+- meddiag_stage_duration_seconds{route, stage}: where a request spent its
+  time, one observation per stage and request:
+    parse       reading and decoding the JSON body
+    validation  Pydantic validation of the body and dependency resolution
+                (plus the row checks of batch endpoints)
+    inference   model scoring, including the wait for the inference executor
+    db_read     SELECT statements
+    db_write    INSERT/UPDATE/DELETE statements, or the wait for the SQLite
+                single writer / the write-behind journal when those are on
+    commit      the database commit
+    serialize   response model validation and JSON encoding
+  Database work done outside a request (the single writer's group commits,
+  the write-behind drain) is reported with route="background".
+- meddiag_predictions_total / meddiag_positive_predictions_total{disease,
+  version} and meddiag_positive_rate{disease, version}: predictions served
+  by each model version and the share of them that were positive
+
+Each observation is a bisect and a few additions under a lock, about a
+microsecond; METRICS_ENABLED=0 removes the instrumentation altogether.
+Every process keeps its own values: with several web workers a scrape sees
+the worker that answered it.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, List, Optional, Sequence
+
+from fastapi import HTTPException
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STAGE_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0,
+)
+BACKGROUND = "background"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """Monotonic counter per label combination."""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str]):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def values(self) -> Dict[tuple, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label combination."""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket (+Inf last), sum]
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, counts, total in sorted(snapshot):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {repr(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+requests_total = Counter("meddiag_requests_total", "Requests handled, by route and status.", ("route", "method", "status"))
+request_duration = Histogram(
+    "meddiag_request_duration_seconds", "Request latency by route.", ("route", "method"), REQUEST_BUCKETS
+)
+stage_duration = Histogram(
+    "meddiag_stage_duration_seconds", "Time per request spent in each stage.", ("route", "stage"), STAGE_BUCKETS
+)
+predictions_total = Counter("meddiag_predictions_total", "Predictions served by model.", ("disease", "version"))
+positive_total = Counter(
+    "meddiag_positive_predictions_total", "Positive predictions served by model.", ("disease", "version")
+)
+
+
+class RequestStages:
+    """Seconds spent in each stage by one request, observed when it ends."""
+
+    __slots__ = ("seconds", "mark", "in_endpoint")
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+        self.mark = time.perf_counter()
+        self.in_endpoint = False
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def lap(self, stage: str) -> None:
+        """Add the time since the previous lap to stage."""
+        now = time.perf_counter()
+        self.add(stage, now - self.mark)
+        self.mark = now
+
+
+_current: ContextVar[Optional[RequestStages]] = ContextVar("meddiag_request_stages", default=None)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Add seconds to stage of the current request, or report it as background work."""
+    if not METRICS_ENABLED:
+        return
+    stages = _current.get()
+    if stages is not None:
+        stages.add(stage, seconds)
+    else:
+        stage_duration.observe((BACKGROUND, stage), seconds)
+
+
+@contextmanager
+def timed(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def count_predictions(disease: str, version: str, total: int, positives: int) -> None:
+    """Add a request's predictions of one model version to the per-disease counters."""
+    if not METRICS_ENABLED:
+        return
+    predictions_total.inc((disease, version), total)
+    if positives:
+        positive_total.inc((disease, version), positives)
+
+
+def _timed_endpoint(endpoint):
+    """Wrap a route's endpoint so that entering it ends validation and leaving it starts serialization."""
+    if asyncio.iscoroutinefunction(endpoint):
+
+        @wraps(endpoint)
+        async def timed_endpoint(*args, **kwargs):
+            stages = _current.get()
+            if stages is not None:
+                stages.lap("validation")
+                stages.in_endpoint = True
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                if stages is not None:
+                    stages.mark = time.perf_counter()
+
+        return timed_endpoint
+
+    @wraps(endpoint)
+    def timed_sync_endpoint(*args, **kwargs):
+        stages = _current.get()
+        if stages is not None:
+            stages.lap("validation")
+            stages.in_endpoint = True
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            if stages is not None:
+                stages.mark = time.perf_counter()
+
+    return timed_sync_endpoint
+
+
+class MetricsRoute(APIRoute):
+    """APIRoute that counts and times its requests, stage by stage (see the module docstring).
+
+    The JSON body is decoded here, under the parse stage; FastAPI then reuses
+    the decoded body (Request.json() caches it) instead of decoding it again.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        route = self.path_format
+        has_body = self.body_field is not None
+
+        async def metrics_handler(request):
+            stages = RequestStages()
+            token = _current.set(stages)
+            started = stages.mark
+            status = 500
+            try:
+                if has_body:
+                    content_type = request.headers.get("content-type")
+                    if not content_type or "json" in content_type:
+                        try:
+                            await request.json()
+                        except (json.JSONDecodeError, UnicodeDecodeError):
+                            pass  # FastAPI decodes it again and answers 422
+                    stages.lap("parse")
+                response = await handler(request)
+                status = response.status_code
+                return response
+            except HTTPException as exc:
+                status = exc.status_code
+                raise
+            except RequestValidationError:
+                status = 422
+                raise
+            finally:
+                _current.reset(token)
+                stages.lap("serialize" if stages.in_endpoint else "validation")
+                _observe(route, request.method, status, stages.mark - started, stages.seconds)
+
+        return metrics_handler
+
+
+def _observe(route: str, method: str, status: int, seconds: float, stages: Dict[str, float]) -> None:
+    requests_total.inc((route, method, str(status)))
+    request_duration.observe((route, method), seconds)
+    for stage, stage_seconds in stages.items():
+        stage_duration.observe((route, stage), stage_seconds)
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is None:
+        return
+    if context.isinsert or context.isupdate or context.isdelete:
+        stage = "db_write"
+    else:
+        stage = "db_read" if statement.lstrip()[:6].upper() in ("SELECT", "WITH") else "db_write"
+    record_stage(stage, time.perf_counter() - started)
+
+
+def instrument_engine(engine) -> None:
+    """Time every statement (db_read / db_write) and commit run through engine."""
+    event.listen(engine, "before_cursor_execute", _before_execute)
+    event.listen(engine, "after_cursor_execute", _after_execute)
+    dialect = engine.dialect
+    do_commit = dialect.do_commit
+
+    def timed_commit(dbapi_connection):
+        started = time.perf_counter()
+        try:
+            do_commit(dbapi_connection)
+        finally:
+            record_stage("commit", time.perf_counter() - started)
+
+    # the dialect has no commit event that fires after the commit returns
+    dialect.do_commit = timed_commit
+
+
+def _positive_rate() -> List[str]:
+    totals = predictions_total.values()
+    positives = positive_total.values()
+    lines = [
+        "# HELP meddiag_positive_rate Share of positive predictions by model since the process started.",
+        "# TYPE meddiag_positive_rate gauge",
+    ]
+    for labels, total in sorted(totals.items()):
+        rate = positives.get(labels, 0) / total if total else 0.0
+        lines.append(f"meddiag_positive_rate{_labels(('disease', 'version'), labels)} {repr(rate)}")
+    return lines
+
+
+def render() -> str:
+    """Every metric in the Prometheus text exposition format."""
+    lines: List[str] = []
+    for family in (requests_total, request_duration, stage_duration, predictions_total, positive_total):
+        lines.extend(family.render())
+    lines.extend(_positive_rate())
+    return "\n".join(lines) + "\n"
+
@@ -1,84 +1,331 @@
 import os
-import pickle
-from typing import Dict, List, Tuple
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 from dotenv import load_dotenv
 
+from app.batching import MicroBatcher
+from app.features import (
+    DIABETES,
+    DIABETES_FEATURE_ORDER,
+    HEART,
+    HEART_FEATURE_ORDER,
+    PARK_FEATURE_ORDER,
+    PARKINSON,
+    FeatureSpec,
+)
+from app.model_registry import ModelEntry, ModelRegistry, default_cache_dir
+from app.scoring import score_matrix
+
 load_dotenv()
 
 WORKING_DIR = os.path.dirname(os.path.abspath(__file__))
 MODEL_DIR = os.getenv("MODEL_DIR", os.path.join(os.path.dirname(WORKING_DIR), "saved_models"))
+# Set COMPILE_MODELS=0 to score with the pickled sklearn estimators directly
+COMPILE_MODELS = os.getenv("COMPILE_MODELS", "1") == "1"
+# Compiled .npy/.json artifacts, keyed by model checksum; a cache, so it is
+# kept out of the source tree and may be read-only (then models compile in memory)
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR") or default_cache_dir()
+# Opt-in coalescing of concurrent single-patient predictions (see app/batching.py)
+MICROBATCH_ENABLED = os.getenv("MICROBATCH_ENABLED", "0") == "1"
+MICROBATCH_MAX_SIZE = int(os.getenv("MICROBATCH_MAX_SIZE", "32"))
+MICROBATCH_MAX_WAIT_US = int(os.getenv("MICROBATCH_MAX_WAIT_US", "500"))
+# LRU/TTL cache of single-patient predictions; PREDICTION_CACHE_SIZE=0 disables it
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "10000"))
+PREDICTION_CACHE_TTL_SECONDS = float(os.getenv("PREDICTION_CACHE_TTL_SECONDS", "300"))
+# Where models are scored: "thread" (in the calling thread) or "process" (a
+# pool of INFERENCE_PROCESSES worker processes, see app/inference_pool.py)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "thread")
+if INFERENCE_BACKEND not in ("thread", "process"):
+    raise ValueError(f"INFERENCE_BACKEND must be thread or process, not {INFERENCE_BACKEND!r}")
+# By default the cores are shared out between the web workers
+INFERENCE_PROCESSES = int(
+    os.getenv("INFERENCE_PROCESSES", str(max(1, (os.cpu_count() or 1) // int(os.getenv("WEB_CONCURRENCY", "1")))))
+)
+# Rows a pool process scores per round trip (its shared-memory slot)
+INFERENCE_POOL_MAX_ROWS = int(os.getenv("INFERENCE_POOL_MAX_ROWS", "1024"))
+
+# Description stored and returned for a positive / negative prediction of each model
+DIAGNOSIS_MESSAGES = {
+    "DIAB": ("La persona puede ser diabética, consulte a su médico.", "La persona no es diabética."),
+    "HEART": ("La persona puede ser cardiaca, consulte a su médico.", "La persona no es cardiaca."),
+    "PARK": ("La persona puede tener Parkinson, consulte a su médico.", "La persona no tiene Parkinson."),
+}
+
+
+def diagnosis_message(name: str, label: int) -> str:
+    positive, negative = DIAGNOSIS_MESSAGES[name]
+    return positive if label == 1 else negative
+
+
+class PredictionCache:
+    """Thread-safe LRU cache of (label, probability) with a time to live.
+
+    Keys are (model name, model version, exact bytes of the float64 row), so
+    a hit is always the result for that very input and a reloaded model never
+    serves results of the version it replaced. Features are not rounded:
+    some are on a 1e-5 scale (Parkinson jitter_abs), where any fixed grid
+    would map different patients to one key.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 300.0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+
+        self._entries: "OrderedDict[tuple, Tuple[float, Tuple[int, float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def key(self, name: str, version: str, row: np.ndarray) -> tuple:
+        """Cache key for one feature row."""
+        return name, version, np.ascontiguousarray(row, dtype=np.float64).tobytes()
+
+    def get(self, key: tuple) -> Optional[Tuple[int, float]]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: tuple, value: Tuple[int, float]) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        """Drop the entries of one model, or all of them."""
+        with self._lock:
+            self._drop(name)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
 
-# Feature orders used for inference
-DIABETES_FEATURE_ORDER = [
-    "Pregnancies",
-    "Glucose",
-    "BloodPressure",
-    "SkinThickness",
-    "Insulin",
-    "BMI",
-    "DiabetesPedigreeFunction",
-    "Age",
-]
-
-HEART_FEATURE_ORDER = [
-    "age",
-    "sex",
-    "cp",
-    "trestbps",
-    "chol",
-    "fbs",
-    "restecg",
-    "thalach",
-    "exang",
-    "oldpeak",
-    "slope",
-    "ca",
-    "thal",
-]
-
-PARK_FEATURE_ORDER = [
-    "fo", "fhi", "flo", "jitter_percent", "jitter_abs",
-    "RAP", "PPQ", "DDP", "shimmer", "shimmer_dB",
-    "APQ3", "APQ5", "APQ", "DDA", "NHR", "HNR",
-    "RPDE", "DFA", "spread1", "spread2", "D2", "PPE",
-]
-
-
-def _load_model(filename: str):
-    path = os.path.join(MODEL_DIR, filename)
-    with open(path, "rb") as f:
-        return pickle.load(f)
-
-
-# Load models once per process
-diabetes_model = _load_model("diabetes_model.sav")
-heart_model = _load_model("heart_disease_model.sav")
-parkinsons_model = _load_model("parkinsons_model.sav")
-
-
-def _predict_binary(model, ordered_features: List[str], features: Dict[str, float]) -> Tuple[int, float]:
-    """Return predicted class and probability (best effort if no predict_proba)."""
-    x = np.array([[float(features[f]) for f in ordered_features]])
-
-    if hasattr(model, "predict_proba"):
-        proba = float(model.predict_proba(x)[0][1])
+    def _drop(self, name: Optional[str]) -> None:
+        if name is None:
+            self._entries.clear()
+        else:
+            for key in [k for k in self._entries if k[0] == name]:
+                del self._entries[key]
+        self.invalidations += 1
+
+
+def predict_row(name: str, row: np.ndarray) -> Tuple[int, float, str]:
+    """Score one float64 row in feature order (see app.features).
+
+    Returns predicted class, probability and the version of the model that
+    scored it. The result is looked up in (and stored to) prediction_cache when
+    enabled, and coalesced with concurrent rows when micro-batching is on.
+    """
+    entry = model_registry.get(name)
+    key = None
+    if prediction_cache is not None:
+        key = prediction_cache.key(name, entry.version, row)
+        cached = prediction_cache.get(key)
+        if cached is not None:
+            return (*cached, entry.version)
+
+    batcher = _batchers.get(name)
+    if batcher is not None:
+        result = batcher.submit(row, entry)
     else:
-        pred = model.predict(x)[0]
-        # fallback probability when model has no predict_proba
-        proba = 1.0 if pred == 1 else 0.0
-    label = int(model.predict(x)[0])
-    return label, proba
+        labels, probas = _score(entry, row[np.newaxis, :])
+        result = int(labels[0]), float(probas[0])
+    if key is not None:
+        prediction_cache.put(key, result)
+    return (*result, entry.version)
+
+
+def submit_row(name: str, row: np.ndarray) -> Future:
+    """predict_row that does not wait for the micro-batch: a future of the same result.
+
+    The caller holds no thread while the batch fills, so an event loop can
+    have as many rows in flight as it has requests. Cache hits and models
+    without a batcher resolve right away.
+    """
+    entry = model_registry.get(name)
+    result: Future = Future()
+    batcher = _batchers.get(name)
+    if batcher is None:
+        result.set_result(predict_row(name, row))
+        return result
+
+    key = None
+    if prediction_cache is not None:
+        key = prediction_cache.key(name, entry.version, row)
+        cached = prediction_cache.get(key)
+        if cached is not None:
+            result.set_result((*cached, entry.version))
+            return result
+
+    def scored(batched: Future) -> None:
+        exc = batched.exception()
+        if exc is not None:
+            result.set_exception(exc)
+            return
+        if key is not None:
+            prediction_cache.put(key, batched.result())
+        result.set_result((*batched.result(), entry.version))
+
+    batcher.submit_nowait(row, entry).add_done_callback(scored)
+    return result
+
+
+def predict_rows(rows: Dict[str, np.ndarray]) -> Dict[str, Tuple[int, float, str]]:
+    """predict_row for each {model name: row}, one model after the other."""
+    return {name: predict_row(name, row) for name, row in rows.items()}
+
+
+def predict_matrix(name: str, x: np.ndarray) -> Tuple[List[Tuple[int, float]], str]:
+    """Score every row of x with a single model call.
+
+    Returns the (label, probability) pairs and the version of the model used.
+    """
+    entry = model_registry.get(name)
+    if x.shape[0] == 0:
+        return [], entry.version
+
+    labels, probas = _score(entry, x)
+    return [(int(label), float(proba)) for label, proba in zip(labels, probas)], entry.version
+
+
+def _matrix(spec: FeatureSpec, rows: List[Dict[str, float]]) -> np.ndarray:
+    x = np.empty((len(rows), spec.n_features))
+    for row, features in zip(x, rows):
+        spec.from_dict(features, out=row, check=False)
+    bad = np.flatnonzero(spec.out_of_range(x))
+    if bad.size:
+        raise ValueError(f"Row {bad[0]}: {spec.range_error(x[bad[0]])}")
+    return x
+
+
+# Models are loaded lazily, on the first prediction that needs them
+DIABETES_MODEL_FILE = "diabetes_model.sav"
+HEART_MODEL_FILE = "heart_disease_model.sav"
+PARK_MODEL_FILE = "parkinsons_model.sav"
+model_registry = ModelRegistry(MODEL_DIR, MODEL_CACHE_DIR, compile=COMPILE_MODELS)
+model_registry.register("DIAB", DIABETES_MODEL_FILE, DIABETES_FEATURE_ORDER)
+model_registry.register("HEART", HEART_MODEL_FILE, HEART_FEATURE_ORDER)
+model_registry.register("PARK", PARK_MODEL_FILE, PARK_FEATURE_ORDER)
+
+
+inference_pool = None
+if INFERENCE_BACKEND == "process":
+    # multiprocessing and shared_memory are only imported when used
+    from app.inference_pool import InferencePool
+
+    inference_pool = InferencePool(model_registry, INFERENCE_PROCESSES, INFERENCE_POOL_MAX_ROWS)
+
+
+def _score(entry: ModelEntry, x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Labels and probabilities of x with this model version, on the configured backend."""
+    if inference_pool is not None:
+        return inference_pool.score(entry, x)
+    return score_matrix(entry.scorer, x)
+
+
+def inference_stats() -> dict:
+    """Backend in use and, for the process pool, its calls and restarts."""
+    return {"backend": INFERENCE_BACKEND, "pool": inference_pool.stats() if inference_pool else None}
+
+
+def _make_batcher(name: str, score_fn) -> Optional[MicroBatcher]:
+    if not MICROBATCH_ENABLED:
+        return None
+    return MicroBatcher(name, score_fn, MICROBATCH_MAX_SIZE, MICROBATCH_MAX_WAIT_US)
+
+
+# the batchers get model entries, so a batch is scored by exactly one version
+diabetes_batcher = _make_batcher("DIAB", _score)
+heart_batcher = _make_batcher("HEART", _score)
+parkinsons_batcher = _make_batcher("PARK", _score)
+_batchers = {
+    name: batcher
+    for name, batcher in (("DIAB", diabetes_batcher), ("HEART", heart_batcher), ("PARK", parkinsons_batcher))
+    if batcher is not None
+}
+
+
+prediction_cache = None
+if PREDICTION_CACHE_SIZE > 0:
+    prediction_cache = PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL_SECONDS)
+
+
+def prediction_cache_stats() -> dict:
+    """Hit/miss counters of the prediction cache, or {"enabled": False}."""
+    if prediction_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **prediction_cache.stats()}
+
+
+def reload_models(names: Optional[List[str]] = None) -> dict:
+    """Hot-swap changed model files (see ModelRegistry.reload) and drop their cached predictions."""
+    results = model_registry.reload(names)
+    if prediction_cache is not None:
+        for name, result in results.items():
+            if result.get("changed"):
+                prediction_cache.invalidate(name)
+    return results
+
+
+def batching_stats() -> dict:
+    """Micro-batcher throughput and latency per disease code (empty when disabled)."""
+    batchers = (diabetes_batcher, heart_batcher, parkinsons_batcher)
+    return {b.name: b.stats() for b in batchers if b is not None}
+
+
+def predict_diabetes(features: Dict[str, float]) -> Tuple[int, float, str]:
+    return predict_row("DIAB", DIABETES.from_dict(features))
+
+
+def predict_heart(features: Dict[str, float]) -> Tuple[int, float, str]:
+    return predict_row("HEART", HEART.from_dict(features))
+
+
+def predict_parkinson(features: Dict[str, float]) -> Tuple[int, float, str]:
+    return predict_row("PARK", PARKINSON.from_dict(features))
 
 
-def predict_diabetes(features: Dict[str, float]) -> Tuple[int, float]:
-    return _predict_binary(diabetes_model, DIABETES_FEATURE_ORDER, features)
+def predict_diabetes_batch(rows: List[Dict[str, float]]) -> Tuple[List[Tuple[int, float]], str]:
+    return predict_matrix("DIAB", _matrix(DIABETES, rows))
 
 
-def predict_heart(features: Dict[str, float]) -> Tuple[int, float]:
-    return _predict_binary(heart_model, HEART_FEATURE_ORDER, features)
+def predict_heart_batch(rows: List[Dict[str, float]]) -> Tuple[List[Tuple[int, float]], str]:
+    return predict_matrix("HEART", _matrix(HEART, rows))
 
 
-def predict_parkinson(features: Dict[str, float]) -> Tuple[int, float]:
-    return _predict_binary(parkinsons_model, PARK_FEATURE_ORDER, features)
+def predict_parkinson_batch(rows: List[Dict[str, float]]) -> Tuple[List[Tuple[int, float]], str]:
+    return predict_matrix("PARK", _matrix(PARKINSON, rows))
@@ -0,0 +1,254 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.scoring import LinearModel, compile_model, load_linear_model, save_linear_model, score_matrix
+
+logger = logging.getLogger(__name__)
+
+
+class ModelEntry:
+    """A loaded model: the object used for scoring plus where it came from."""
+
+    __slots__ = ("name", "path", "scorer", "checksum", "version", "source", "load_seconds", "loaded_at")
+
+    def __init__(self, name: str, path: str, scorer, checksum: str, source: str, load_seconds: float):
+        self.name = name
+        self.path = path
+        self.scorer = scorer
+        self.checksum = checksum
+        self.version = checksum[:12]
+        self.source = source
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+
+    def info(self) -> dict:
+        return {
+            "loaded": True,
+            "file": os.path.basename(self.path),
+            "version": self.version,
+            "sha256": self.checksum,
+            "source": self.source,
+            "load_ms": self.load_seconds * 1000.0,
+            "loaded_at": self.loaded_at,
+        }
+
+
+def default_cache_dir() -> str:
+    """Per-user cache for compiled artifacts ($XDG_CACHE_HOME/meddiag/compiled), outside the source tree."""
+    cache_home = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "meddiag", "compiled")
+
+
+def file_checksum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    """Loads each registered model on first use and keeps it for the process.
+
+    The version of a model is the sha256 of its pickled file. With compile=True
+    the parameters are read, memory-mapped, from the first of:
+
+    - the exported model next to the pickle (diabetes_model.json + .npy, see
+      app/export_models.py), when it was exported from the current pickle or
+      the pickle is not deployed at all
+    - <cache_dir>/<name>-<version>.npy (+ .json), compiled by an earlier load
+
+    Neither pickle nor sklearn is touched then, and forked workers share the
+    pages. Otherwise the pickle is loaded and a supported linear model compiled
+    into the cache; models that cannot be compiled, or compile=False, are
+    scored with the unpickled estimator.
+
+    reload() swaps in a new version of a model file without stopping the
+    process: the new model is loaded and validated first, then replaces the
+    entry in one assignment. Callers that already took an entry keep scoring
+    with it, so in-flight requests finish on the old model.
+    """
+
+    def __init__(self, model_dir: str, cache_dir: Optional[str] = None, compile: bool = True):
+        self.model_dir = model_dir
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.compile = compile
+        self._files: Dict[str, Tuple[str, List[str]]] = {}
+        self._entries: Dict[str, ModelEntry] = {}
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+
+    def register(self, name: str, filename: str, feature_order: List[str]) -> None:
+        """Add a model; feature_order is checked against every version that gets loaded."""
+        self._files[name] = (filename, list(feature_order))
+
+    def names(self) -> list:
+        return list(self._files)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.model_dir, self._files[name][0])
+
+    def exported_stem(self, name: str) -> str:
+        return os.path.splitext(self.path(name))[0]
+
+    def feature_order(self, name: str) -> List[str]:
+        return self._files[name][1]
+
+    def get(self, name: str) -> ModelEntry:
+        entry = self._entries.get(name)
+        if entry is not None:
+            return entry
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                entry = self._load(name)
+                self._validate(entry)
+                self._entries[name] = entry
+        return entry
+
+    def scorer(self, name: str):
+        return self.get(name).scorer
+
+    def load_all(self) -> None:
+        for name in self._files:
+            self.get(name)
+
+    def reload(self, names: Optional[list] = None) -> dict:
+        """Reload the given models (default: all) whose file changed.
+
+        Returns {name: {"previous", "version", "changed"}}, or {"error"} for a
+        model whose new version failed to load or validate; that model keeps
+        serving its current version. Models not loaded yet are left alone (their
+        first use loads the current file) and reported as {"loaded": False}.
+        """
+        results = {}
+        with self._reload_lock:
+            for name in names or list(self._files):
+                current = self._entries.get(name)
+                if current is None:
+                    results[name] = {"loaded": False}
+                    continue
+                previous = current.version
+                try:
+                    if self._source_checksum(name) == current.checksum:
+                        results[name] = {"previous": previous, "version": previous, "changed": False}
+                        continue
+                    entry = self._load(name)
+                    self._validate(entry)
+                except Exception as exc:
+                    logger.error("Reload of model %s failed, keeping %s: %r", name, previous, exc)
+                    results[name] = {"previous": previous, "error": repr(exc)}
+                    continue
+                with self._lock:
+                    self._entries[name] = entry
+                logger.info("Model %s reloaded: %s -> %s (%s)", name, previous, entry.version, entry.source)
+                results[name] = {"previous": previous, "version": entry.version, "changed": True}
+        return results
+
+    def load_version(self, name: str, checksum: str) -> Optional[ModelEntry]:
+        """Entry for the version of `name` compiled from the pickle with this sha256, if still on disk.
+
+        Reads its compiled artifact, or the export next to the pickle when that
+        was made from the same pickle; None when neither is there (e.g.
+        compile=False or a model that cannot be compiled). The registry itself
+        is not changed.
+        """
+        if not self.compile:
+            return None
+        started = time.perf_counter()
+        candidates = ((self._artifact_stem(name, checksum), "artifact"), (self.exported_stem(name), "exported"))
+        for stem, source in candidates:
+            entry = self._load_artifact(name, stem, checksum, source, started, warn_stale=False)
+            if entry is not None:
+                self._validate(entry)
+                return entry
+        return None
+
+    def info(self) -> dict:
+        models = {}
+        for name, (filename, _) in self._files.items():
+            entry = self._entries.get(name)
+            models[name] = entry.info() if entry is not None else {"loaded": False, "file": filename}
+        return models
+
+    def _validate(self, entry: ModelEntry) -> None:
+        """Score a probe matrix; raises ValueError if the model does not fit its slot."""
+        n_features = len(self.feature_order(entry.name))
+        expected = getattr(entry.scorer, "n_features", getattr(entry.scorer, "n_features_in_", n_features))
+        if expected != n_features:
+            raise ValueError(f"{entry.name} expects {expected} features, not {n_features}")
+        labels, probas = score_matrix(entry.scorer, np.zeros((2, n_features)))
+        if len(labels) != 2 or not np.all((probas >= 0.0) & (probas <= 1.0)):
+            raise ValueError(f"{entry.name} returned invalid scores for a probe input")
+
+    def _artifact_stem(self, name: str, checksum: str) -> str:
+        return os.path.join(self.cache_dir, f"{name}-{checksum[:16]}")
+
+    def _source_checksum(self, name: str) -> str:
+        """sha256 of the pickle, or the one recorded by the export when only that is deployed."""
+        path = self.path(name)
+        if os.path.exists(path):
+            return file_checksum(path)
+        with open(f"{self.exported_stem(name)}.json", "rb") as f:
+            return json.load(f)["sha256"]
+
+    def _load_artifact(
+        self, name: str, stem: str, checksum: Optional[str], source: str, started: float, warn_stale: bool = True
+    ):
+        """ModelEntry for the artifact at stem, or None if missing, unreadable or stale."""
+        try:
+            model, header = load_linear_model(stem)
+        except (OSError, ValueError, KeyError):
+            return None
+        if checksum is not None and header.get("sha256") != checksum:
+            if warn_stale:
+                logger.warning("Ignoring %s: it was not built from the current %s", stem, self._files[name][0])
+            return None
+        order = header.get("feature_order")
+        if order is not None and order != self.feature_order(name):
+            raise ValueError(f"{stem}.json has feature order {order}, expected {self.feature_order(name)}")
+        return ModelEntry(name, self.path(name), model, header["sha256"], source, time.perf_counter() - started)
+
+    def _load(self, name: str) -> ModelEntry:
+        started = time.perf_counter()
+        path = self.path(name)
+        checksum = file_checksum(path) if os.path.exists(path) else None
+
+        if self.compile:
+            entry = self._load_artifact(name, self.exported_stem(name), checksum, "exported", started)
+            if entry is None and checksum is not None:
+                stem = self._artifact_stem(name, checksum)
+                entry = self._load_artifact(name, stem, checksum, "artifact", started)
+            if entry is not None:
+                return entry
+        if checksum is None:
+            raise FileNotFoundError(f"No model file or export for {name}: {path}")
+
+        try:
+            with open(path, "rb") as f:
+                estimator = pickle.load(f)
+        except ImportError as exc:  # inference-only install (requirements-api.txt) has no sklearn
+            raise RuntimeError(
+                f"{name}: no usable export of {self._files[name][0]} and {exc.name} is not installed; "
+                "run python -m app.export_models where scikit-learn is available"
+            ) from exc
+        if not self.compile:
+            return ModelEntry(name, path, estimator, checksum, "pickle", time.perf_counter() - started)
+
+        scorer = compile_model(estimator)
+        stem = self._artifact_stem(name, checksum)
+        if isinstance(scorer, LinearModel):
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                save_linear_model(scorer, stem, name=name, source=os.path.basename(path), sha256=checksum)
+            except OSError as exc:  # read-only model dir: keep serving from memory
+                logger.warning("Could not write compiled model %s: %r", stem, exc)
+        return ModelEntry(name, path, scorer, checksum, "compiled", time.perf_counter() - started)
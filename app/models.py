@@ -8,6 +8,7 @@ from sqlalchemy import (
     CheckConstraint,
     UniqueConstraint,
     DateTime,
+    Index,
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -23,6 +24,11 @@ class User(Base):
     gender = Column(String(1), CheckConstraint("gender IN ('M','F','O')"))
     email = Column(Text, unique=True)
 
+    __table_args__ = (
+        # history lookups by patient name are case-insensitive
+        Index("ix_users_name_lower", func.lower(name)),
+    )
+
     diagnoses = relationship("Diagnosis", back_populates="user")
 
 
@@ -55,9 +61,14 @@ class Diagnosis(Base):
     generated_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     status = Column(Text, nullable=False, server_default="pending")
     final_description = Column(Text)
+    # Client-side id of a write-behind record, so replaying the journal is idempotent
+    external_ref = Column(Text)
 
     __table_args__ = (
         CheckConstraint("status IN ('pending','confirmed','discarded')", name="ck_diagnosis_status"),
+        Index("ix_diagnoses_generated_at", "generated_at"),
+        Index("ix_diagnoses_user_id_generated_at", "user_id", "generated_at"),
+        Index("ux_diagnoses_external_ref", "external_ref", unique=True),
     )
 
     user = relationship("User", back_populates="diagnoses")
@@ -72,6 +83,8 @@ class DiagnosisDetail(Base):
     diagnosis_id = Column(Integer, ForeignKey("diagnoses.id", ondelete="CASCADE"), nullable=False)
     disease_id = Column(Integer, ForeignKey("diseases.id", ondelete="RESTRICT"), nullable=False)
     probability = Column(Numeric(5, 4), nullable=False)
+    # Version (sha256 prefix) of the model that produced the probability
+    model_version = Column(Text)
 
     __table_args__ = (
         CheckConstraint("probability >= 0 AND probability <= 1", name="ck_probability_range"),
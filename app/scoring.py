@@ -0,0 +1,262 @@
+"""Scoring kernels shared by the API and the model registry.
+
+LinearModel is a fitted binary linear classifier reduced to NumPy arrays, and
+its parameters can be saved as a compiled artifact (<stem>.npy + <stem>.json)
+that loads memory-mapped, without unpickling or importing sklearn.
+"""
+import json
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Bump when the artifact layout changes; older artifacts are then recompiled
+ARTIFACT_FORMAT = 1
+
+
+def _expit(scores: np.ndarray) -> np.ndarray:
+    """Logistic sigmoid, as scipy.special.expit used by LogisticRegression (within 1 ulp of exp)."""
+    with np.errstate(over="ignore"):
+        return 1.0 / (1.0 + np.exp(-scores))
+
+
+def _has_platt(model) -> bool:
+    """True for SVC estimators trained with probability=True."""
+    return np.size(getattr(model, "probA_", ())) > 0
+
+
+def _platt_proba(scores: np.ndarray, prob_a: float, prob_b: float) -> np.ndarray:
+    """Positive-class probability of a binary SVC, replicating libsvm's predict_probability.
+
+    libsvm applies the sigmoid to its own decision values (sign flipped with
+    respect to sklearn's decision_function) and then runs the pairwise coupling
+    iteration of multiclass_probability, which for two classes is reproduced here.
+    """
+    f_ab = -scores * prob_a + prob_b
+    with np.errstate(over="ignore", invalid="ignore"):
+        r = np.where(
+            f_ab >= 0,
+            np.exp(-f_ab) / (1.0 + np.exp(-f_ab)),
+            1.0 / (1 + np.exp(f_ab)),
+        )
+    r01 = np.minimum(np.maximum(r, 1e-7), 1 - 1e-7)
+    r10 = 1 - r01
+    q = ((r10 * r10, -r10 * r01), (-r01 * r10, r01 * r01))
+
+    p = [np.full_like(r01, 0.5), np.full_like(r01, 0.5)]
+    active = np.ones(r01.shape, dtype=bool)
+    for _ in range(100):
+        qp = [q[t][0] * p[0] + q[t][1] * p[1] for t in range(2)]
+        pqp = p[0] * qp[0] + p[1] * qp[1]
+        max_error = np.maximum(np.abs(qp[0] - pqp), np.abs(qp[1] - pqp))
+        active &= max_error >= 0.005 / 2
+        if not active.any():
+            break
+        for t in range(2):
+            diff = np.where(active, (-qp[t] + pqp) / q[t][t], 0.0)
+            p[t] = p[t] + diff
+            pqp = (pqp + diff * (diff * q[t][t] + 2 * qp[t])) / (1 + diff) / (1 + diff)
+            for j in range(2):
+                qp[j] = (qp[j] + diff * q[t][j]) / (1 + diff)
+                p[j] = p[j] / (1 + diff)
+    return p[1]
+
+
+class LinearModel:
+    """A fitted binary linear classifier reduced to plain NumPy arrays.
+
+    Scores with a single fused ``x @ weights + intercept`` (after the optional
+    StandardScaler step) and skips sklearn's input validation and dispatch.
+    The original estimator is kept in ``estimator``.
+    """
+
+    __slots__ = (
+        "kind", "classes", "weights", "intercept", "mean", "scale", "prob_a", "prob_b", "estimator",
+    )
+
+    def __init__(
+        self,
+        kind: str,
+        classes: np.ndarray,
+        weights: np.ndarray,
+        intercept: float,
+        mean: Optional[np.ndarray] = None,
+        scale: Optional[np.ndarray] = None,
+        prob_a: Optional[float] = None,
+        prob_b: Optional[float] = None,
+        estimator=None,
+    ):
+        self.kind = kind
+        self.classes = classes
+        self.weights = weights
+        self.intercept = intercept
+        self.mean = mean
+        self.scale = scale
+        self.prob_a = prob_a
+        self.prob_b = prob_b
+        self.estimator = estimator
+
+    @property
+    def n_features(self) -> int:
+        return self.weights.shape[0]
+
+    def decision_function(self, x: np.ndarray) -> np.ndarray:
+        if self.mean is not None:
+            x = x - self.mean
+        if self.scale is not None:
+            x = x / self.scale
+        return x @ self.weights + self.intercept
+
+    def score_matrix(self, x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        scores = self.decision_function(x)
+        if self.kind == "logistic":
+            return self.classes[(scores > 0).astype(int)], _expit(scores)
+
+        # libsvm votes for the second class when its own (negated) decision value is <= 0
+        labels = self.classes[(scores >= 0).astype(int)]
+        if self.prob_a is not None:
+            return labels, _platt_proba(scores, self.prob_a, self.prob_b)
+        return labels, np.where(labels == 1, 1.0, 0.0)
+
+
+def compile_model(estimator):
+    """Return a LinearModel for supported linear estimators, else the estimator unchanged.
+
+    Supported: binary LogisticRegression (one-vs-rest probabilities) and binary
+    SVC with a linear kernel, optionally behind a StandardScaler in a Pipeline.
+    Classes are matched by name so compiling never imports sklearn itself.
+    """
+    scaler = None
+    clf = estimator
+    if hasattr(estimator, "steps"):
+        steps = [step for _, step in estimator.steps if step not in (None, "passthrough")]
+        if len(steps) == 2 and type(steps[0]).__name__ == "StandardScaler":
+            scaler, clf = steps
+        elif len(steps) == 1:
+            clf = steps[0]
+        else:
+            return estimator
+
+    classes = getattr(clf, "classes_", None)
+    if classes is None or len(classes) != 2:
+        return estimator
+
+    clf_type = type(clf).__name__
+    if clf_type == "LogisticRegression" and getattr(clf, "multi_class", "auto") != "multinomial":
+        kind = "logistic"
+    elif clf_type == "SVC" and clf.kernel == "linear":
+        kind = "svc"
+    else:
+        return estimator
+
+    prob_a = prob_b = None
+    if kind == "svc" and _has_platt(clf):
+        prob_a, prob_b = float(clf.probA_[0]), float(clf.probB_[0])
+
+    mean = scale = None
+    if scaler is not None:
+        mean = np.array(scaler.mean_, dtype=float) if scaler.with_mean else None
+        scale = np.array(scaler.scale_, dtype=float) if scaler.with_std else None
+
+    return LinearModel(
+        kind=kind,
+        classes=np.asarray(classes),
+        weights=np.ascontiguousarray(clf.coef_[0], dtype=float),
+        intercept=float(clf.intercept_[0]),
+        mean=mean,
+        scale=scale,
+        prob_a=prob_a,
+        prob_b=prob_b,
+        estimator=estimator,
+    )
+
+
+def score_matrix(model, x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Labels and positive-class probabilities for every row of x from one scoring pass.
+
+    - LinearModel: the compiled NumPy kernel.
+    - SVC with Platt scaling: decision_function, label from its sign (as predict does)
+      and the probability from the cached probA_/probB_ calibration.
+    - Models with predict_proba: label is the most probable class.
+    - Anything else: a single predict, probability 1.0/0.0 as before.
+    """
+    if isinstance(model, LinearModel):
+        return model.score_matrix(x)
+
+    classes = model.classes_
+    if _has_platt(model):
+        scores = model.decision_function(x)
+        labels = classes[(scores >= 0).astype(int)]
+        probas = _platt_proba(scores, float(model.probA_[0]), float(model.probB_[0]))
+    elif hasattr(model, "predict_proba"):
+        proba_matrix = model.predict_proba(x)
+        labels = classes[np.argmax(proba_matrix, axis=1)]
+        probas = proba_matrix[:, 1]
+    else:
+        labels = model.predict(x)
+        # fallback probability when model has no predict_proba
+        probas = np.where(labels == 1, 1.0, 0.0)
+    return labels, probas
+
+
+def _replace_atomically(path: str, write) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def save_linear_model(model: LinearModel, stem: str, **meta) -> None:
+    """Write model as <stem>.npy and <stem>.json; extra meta goes into the JSON header.
+
+    The .npy holds weights, then mean and scale when present, as one float64
+    vector so it can be memory-mapped. The JSON is written last, so its
+    presence means the artifact is complete.
+    """
+    arrays = [model.weights] + [a for a in (model.mean, model.scale) if a is not None]
+    params = np.ascontiguousarray(np.concatenate(arrays), dtype=np.float64)
+    header = {
+        "format": ARTIFACT_FORMAT,
+        "kind": model.kind,
+        "classes": model.classes.tolist(),
+        "n_features": model.n_features,
+        "intercept": model.intercept,
+        "has_mean": model.mean is not None,
+        "has_scale": model.scale is not None,
+        "prob_a": model.prob_a,
+        "prob_b": model.prob_b,
+        **meta,
+    }
+    _replace_atomically(f"{stem}.npy", lambda f: np.save(f, params))
+    _replace_atomically(f"{stem}.json", lambda f: f.write(json.dumps(header, indent=2).encode()))
+
+
+def load_linear_model(stem: str, mmap: bool = True) -> Tuple[LinearModel, dict]:
+    """Inverse of save_linear_model; returns the model and its JSON header.
+
+    With mmap the parameter vector is mapped read-only, so forked workers share
+    the same physical pages instead of each holding a copy.
+    """
+    with open(f"{stem}.json", "rb") as f:
+        header = json.load(f)
+    if header.get("format") != ARTIFACT_FORMAT:
+        raise ValueError(f"Unsupported model artifact format in {stem}.json")
+
+    params = np.load(f"{stem}.npy", mmap_mode="r" if mmap else None)
+    n = header["n_features"]
+    views = iter(params[i:i + n] for i in range(0, len(params), n))
+    weights = np.asarray(next(views))
+    mean = np.asarray(next(views)) if header["has_mean"] else None
+    scale = np.asarray(next(views)) if header["has_scale"] else None
+
+    model = LinearModel(
+        kind=header["kind"],
+        classes=np.asarray(header["classes"]),
+        weights=weights,
+        intercept=header["intercept"],
+        mean=mean,
+        scale=scale,
+        prob_a=header["prob_a"],
+        prob_b=header["prob_b"],
+    )
+    return model, header
@@ -0,0 +1,398 @@
+"""Score a CSV or Parquet extract offline with the API's models.
+
+The input is read in chunks of --chunk-size rows. Each chunk is vectorized
+in the model's feature order (columns named as in app/features.py) and
+scored by one call, optionally on a pool of --workers processes. Rows with a
+missing, non-numeric or out-of-range feature are counted as invalid and get
+no score.
+
+- --output writes one line per input row (.csv, or .parquet with pyarrow):
+  row number, the --id-column if given, prediction, probability and model
+  version.
+- --db also stores the valid rows as diagnoses, one transaction per chunk,
+  with COPY on Postgres. Every diagnosis gets the external_ref
+  <run id>:<row>, so loading the same run again skips what is already
+  stored.
+
+At most 2 x workers + 1 chunks are in memory at a time, whatever the size of
+the input.
+
+    python -m app.screening INPUT --disease DIAB [--output OUT] [--db]
+        [--chunk-size 50000] [--workers N] [--id-column COL]
+        [--name-column COL] [--email-column COL] [--run-id ID]
+
+Parquet needs pyarrow, which is not part of the API's requirements.
+"""
+import argparse
+import csv
+import hashlib
+import itertools
+import operator
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, NamedTuple, Optional
+
+import numpy as np
+
+from app.features import SPECS
+from app.model_predict import diagnosis_message, model_registry
+from app.scoring import score_matrix
+
+CHUNK_SIZE = 50_000
+PROGRESS_SECONDS = 5.0
+
+
+class CsvLayout(NamedTuple):
+    """Where the features and carried columns are in each CSV record."""
+
+    features: operator.itemgetter
+    columns: dict  # {column: index}
+    width: int
+
+
+class Scores(NamedTuple):
+    valid: np.ndarray
+    labels: np.ndarray
+    probas: np.ndarray
+    version: str
+
+
+def _is_parquet(path: str) -> bool:
+    return path.endswith((".parquet", ".pq"))
+
+
+def read_csv(path: str, features: List[str], extra: List[str], chunk_size: int) -> tuple:
+    """(CsvLayout, chunks of raw lines); records are parsed where the chunk is scored.
+
+    A chunk only ends on a line with an even running count of quotes, so a
+    quoted field with line breaks is never split between two chunks.
+    """
+    f = open(path, newline="")
+    header = next(csv.reader([f.readline()]), [])
+    index = {column: i for i, column in enumerate(header)}
+    missing = [column for column in features + extra if column not in index]
+    if missing:
+        f.close()
+        raise ValueError(f"{path}: missing columns: {', '.join(missing)}")
+    layout = CsvLayout(
+        operator.itemgetter(*(index[column] for column in features)),
+        {column: index[column] for column in extra},
+        max(index[column] for column in features) + 1,
+    )
+
+    def chunks() -> Iterator[List[str]]:
+        with f:
+            while True:
+                lines = list(itertools.islice(f, chunk_size))
+                if not lines:
+                    return
+                quotes = sum(line.count('"') for line in lines)
+                while quotes % 2:
+                    line = f.readline()
+                    if not line:
+                        break
+                    lines.append(line)
+                    quotes += line.count('"')
+                yield lines
+
+    return layout, chunks()
+
+
+def parse_csv(lines: List[str], layout: CsvLayout) -> tuple:
+    """(feature values, carried columns) of raw CSV lines."""
+    records = list(csv.reader(lines))
+    width = layout.width
+    get_features = layout.features
+    # a short record gets () and is reported invalid instead of failing the chunk
+    values = [get_features(record) if len(record) >= width else () for record in records]
+    columns = {
+        column: [record[i] if i < len(record) else None for record in records]
+        for column, i in layout.columns.items()
+    }
+    return values, columns
+
+
+def read_parquet(path: str, features: List[str], extra: List[str], chunk_size: int) -> tuple:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("reading Parquet needs pyarrow (pip install pyarrow)") from None
+
+    parquet = pq.ParquetFile(path)
+    missing = [column for column in features + extra if column not in parquet.schema_arrow.names]
+    if missing:
+        raise ValueError(f"{path}: missing columns: {', '.join(missing)}")
+
+    def chunks() -> Iterator[tuple]:
+        for batch in parquet.iter_batches(batch_size=chunk_size, columns=features + extra):
+            x = np.empty((batch.num_rows, len(features)))
+            for j, column in enumerate(features):
+                # nulls become NaN, which the range check rejects
+                x[:, j] = batch.column(column).cast(pa.float64()).to_numpy(zero_copy_only=False)
+            yield x, {column: batch.column(column).to_pylist() for column in extra}
+
+    return None, chunks()
+
+
+def to_matrix(values, n_features: int) -> np.ndarray:
+    """float64 matrix of a chunk; rows that cannot be parsed become NaN."""
+    if isinstance(values, np.ndarray):
+        return values
+    try:
+        return np.array(values, dtype=np.float64)
+    except ValueError:
+        x = np.full((len(values), n_features), np.nan)
+        for i, row in enumerate(values):
+            try:
+                x[i] = row
+            except (TypeError, ValueError):
+                pass
+        return x
+
+
+def score_chunk(name: str, chunk, layout: Optional[CsvLayout]) -> tuple:
+    """(Scores, carried columns) of raw CSV lines, or of a (matrix, columns) Parquet chunk."""
+    data, columns = parse_csv(chunk, layout) if layout is not None else chunk
+    spec = SPECS[name]
+    x = to_matrix(data, spec.n_features)
+    valid = ~spec.out_of_range(x)
+    entry = model_registry.get(name)
+    if valid.all():
+        labels, probas = score_matrix(entry.scorer, x)
+    else:
+        labels = np.zeros(len(x), dtype=np.int64)
+        probas = np.full(len(x), np.nan)
+        if valid.any():
+            labels[valid], probas[valid] = score_matrix(entry.scorer, x[valid])
+    return Scores(valid, labels, probas, entry.version), columns
+
+
+def _load_model(name: str) -> None:
+    model_registry.get(name)
+
+
+def scored_chunks(chunks: Iterator, name: str, layout: Optional[CsvLayout], workers: int) -> Iterator[tuple]:
+    """(first row number, carried columns, Scores) per chunk, in input order.
+
+    Chunks are scored here, or with workers > 1 on a process pool, which then
+    also parses the CSV.
+    """
+    start = 0
+    if workers <= 1:
+        for chunk in chunks:
+            scores, columns = score_chunk(name, chunk, layout)
+            yield start, columns, scores
+            start += len(scores.valid)
+        return
+
+    _load_model(name)  # forked workers inherit the memory-mapped model
+    with ProcessPoolExecutor(workers, initializer=_load_model, initargs=(name,)) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(score_chunk, name, chunk, layout))
+            # at most 2 x workers + 1 chunks in memory: a slow consumer slows down the reading
+            while len(pending) > 2 * workers or (pending and pending[0].done()):
+                scores, columns = pending.popleft().result()
+                yield start, columns, scores
+                start += len(scores.valid)
+        while pending:
+            scores, columns = pending.popleft().result()
+            yield start, columns, scores
+            start += len(scores.valid)
+
+
+def _result_columns(start: int, scores: Scores) -> tuple:
+    """Row numbers, predictions and probabilities as lists; invalid rows get None."""
+    rows = range(start, start + len(scores.valid))
+    labels = scores.labels.tolist()
+    probas = scores.probas.tolist()
+    for i in np.flatnonzero(~scores.valid):
+        labels[i] = None
+        probas[i] = None
+    return rows, labels, probas
+
+
+class CsvOutput:
+    def __init__(self, path: str, id_column: Optional[str]):
+        self.id_column = id_column
+        self._file = open(path, "w", newline="")
+        self._writer = csv.writer(self._file)
+        header = ["row", *([id_column] if id_column else []), "prediction", "probability", "model_version"]
+        self._writer.writerow(header)
+
+    def write(self, start: int, columns: dict, scores: Scores) -> None:
+        rows, labels, probas = _result_columns(start, scores)
+        versions = itertools.repeat(scores.version)
+        if self.id_column:
+            self._writer.writerows(zip(rows, columns[self.id_column], labels, probas, versions))
+        else:
+            self._writer.writerows(zip(rows, labels, probas, versions))
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetOutput:
+    def __init__(self, path: str, id_column: Optional[str]):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("writing Parquet needs pyarrow (pip install pyarrow)") from None
+        self._pa = pa
+        self.path = path
+        self.id_column = id_column
+        self._writer = None
+        self._pq = pq
+
+    def write(self, start: int, columns: dict, scores: Scores) -> None:
+        rows, labels, probas = _result_columns(start, scores)
+        table = {"row": list(rows)}
+        if self.id_column:
+            table[self.id_column] = columns[self.id_column]
+        table.update(prediction=labels, probability=probas, model_version=[scores.version] * len(labels))
+        table = self._pa.table(table)
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+
+class DatabaseOutput:
+    """Stores the valid rows of each chunk as diagnoses, committing per chunk."""
+
+    def __init__(self, name: str, run_id: str, name_column: Optional[str], email_column: Optional[str]):
+        from app.utils.database import Base, SessionLocal, engine
+        from app.utils.migrations import run_migrations
+        from app.utils import crud
+
+        Base.metadata.create_all(bind=engine)
+        run_migrations(engine)
+        with SessionLocal() as db:
+            crud.seed_default_diseases(db)
+        self._session = SessionLocal
+        self._crud = crud
+        self.name = name
+        self.run_id = run_id
+        self.name_column = name_column
+        self.email_column = email_column
+        self.stored = 0
+
+    def write(self, start: int, columns: dict, scores: Scores) -> None:
+        names = columns.get(self.name_column) if self.name_column else None
+        emails = columns.get(self.email_column) if self.email_column else None
+        records = []
+        for i in np.flatnonzero(scores.valid).tolist():
+            label = int(scores.labels[i])
+            records.append({
+                "external_ref": f"{self.run_id}:{start + i}",
+                "patient": {"name": names[i] if names else None, "email": (emails[i] or None) if emails else None},
+                "disease_code": self.name,
+                "probability": float(scores.probas[i]),
+                "final_description": diagnosis_message(self.name, label),
+                "model_version": scores.version,
+            })
+        if not records:
+            return
+        with self._session() as db:
+            self.stored += self._crud.copy_diagnoses_from_records(db, records)
+            db.commit()
+
+    def close(self) -> None:
+        pass
+
+
+def default_run_id(path: str, name: str, version: str) -> str:
+    """Same input file, model and version -> same run id, so a rerun does not duplicate diagnoses."""
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}:{name}:{version}"
+    return f"screen-{hashlib.sha256(key.encode()).hexdigest()[:12]}"
+
+
+def run(args) -> dict:
+    name = args.disease
+    spec = SPECS[name]
+    version = model_registry.get(name).version
+    extra = [c for c in dict.fromkeys((args.id_column, args.name_column, args.email_column)) if c]
+
+    outputs = []
+    if args.output:
+        output_cls = ParquetOutput if _is_parquet(args.output) else CsvOutput
+        outputs.append(output_cls(args.output, args.id_column))
+    if args.db:
+        run_id = args.run_id or default_run_id(args.input, name, version)
+        outputs.append(DatabaseOutput(name, run_id, args.name_column, args.email_column))
+
+    reader = read_parquet if _is_parquet(args.input) else read_csv
+    layout, chunks = reader(args.input, spec.order, extra, args.chunk_size)
+
+    rows = invalid = 0
+    started = last_report = time.perf_counter()
+    try:
+        for start, columns, scores in scored_chunks(chunks, name, layout, args.workers):
+            for output in outputs:
+                output.write(start, columns, scores)
+            rows += len(scores.valid)
+            invalid += int(np.count_nonzero(~scores.valid))
+            now = time.perf_counter()
+            if now - last_report >= PROGRESS_SECONDS:
+                print(f"{name}: {rows} rows, {rows / (now - started):.0f} rows/s", file=sys.stderr)
+                last_report = now
+    finally:
+        for output in outputs:
+            output.close()
+    elapsed = time.perf_counter() - started
+    stats = {
+        "rows": rows,
+        "invalid": invalid,
+        "seconds": elapsed,
+        "rows_per_second": rows / elapsed if elapsed else 0.0,
+        "model_version": version,
+    }
+    if args.db:
+        stats["stored"] = outputs[-1].stored
+    return stats
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("input", help="CSV file with a header row, or .parquet")
+    parser.add_argument("--disease", required=True, choices=list(SPECS), help="model to score with")
+    parser.add_argument("--output", help="write predictions to this .csv or .parquet file")
+    parser.add_argument("--db", action="store_true", help="store the predictions as diagnoses in DATABASE_URL")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help=f"rows per chunk (default {CHUNK_SIZE})")
+    parser.add_argument("--workers", type=int, default=1, help="score chunks on this many processes (default 1)")
+    parser.add_argument("--id-column", help="input column copied to the output to join predictions back")
+    parser.add_argument("--name-column", help="patient name column, for --db")
+    parser.add_argument("--email-column", help="patient email column, for --db (identifies returning patients)")
+    parser.add_argument("--run-id", help="prefix of the diagnoses' external_ref (default: derived from the input)")
+    args = parser.parse_args(argv)
+    if not args.output and not args.db:
+        parser.error("nothing to do: give --output and/or --db")
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+
+    try:
+        stats = run(args)
+    except (OSError, ValueError, RuntimeError) as exc:
+        print(f"{args.disease}: {exc}", file=sys.stderr)
+        return 1
+    line = (
+        f"{args.disease}: {stats['rows']} rows ({stats['invalid']} invalid) in {stats['seconds']:.2f} s, "
+        f"{stats['rows_per_second']:.0f} rows/s, model {stats['model_version']}"
+    )
+    if "stored" in stats:
+        line += f", {stats['stored']} new diagnoses"
+    print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
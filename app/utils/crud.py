@@ -1,9 +1,98 @@
+import base64
+import csv
+import functools
+import io
+import json
+import threading
+from datetime import datetime
+
+from sqlalchemy import Text, bindparam, cast, event, func, insert, literal, select, text, tuple_, union_all
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from app.models import User, Disease, Diagnosis, DiagnosisDetail
 from app.utils.validators import validate_probability
 
 
-def get_or_create_user(
+class DiseaseRegistry:
+    """In-memory disease_code -> id map, so the prediction path does not query diseases.
+
+    Loaded once at startup. Any ORM insert/update/delete of a Disease clears it
+    (see the mapper events below), and an unknown code triggers one reload before
+    failing, which also covers diseases added by another worker process.
+    """
+
+    def __init__(self):
+        self._ids: dict[str, int] | None = None
+        self._lock = threading.Lock()
+
+    def load(self, db: Session) -> dict[str, int]:
+        ids = dict(db.query(Disease.disease_code, Disease.id).all())
+        with self._lock:
+            self._ids = ids
+        return ids
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._ids = None
+
+    def get_id(self, db: Session, disease_code: str) -> int:
+        ids = self._ids
+        if ids is None or disease_code not in ids:
+            # the map just loaded, even if invalidate() already cleared self._ids
+            ids = self.load(db)
+        if disease_code not in ids:
+            raise ValueError(f"Disease with code {disease_code} not found")
+        return ids[disease_code]
+
+
+disease_registry = DiseaseRegistry()
+
+
+@event.listens_for(Disease, "after_insert")
+@event.listens_for(Disease, "after_update")
+@event.listens_for(Disease, "after_delete")
+def _invalidate_disease_registry(mapper, connection, target) -> None:
+    disease_registry.invalidate()
+
+
+def _user_row(
+    name: str,
+    email: str | None = None,
+    gender: str | None = None,
+    phone_number: str | None = None,
+) -> dict:
+    return {
+        "name": name or "Paciente sin nombre",
+        "email": email,
+        "gender": gender,
+        "phone_number": phone_number,
+    }
+
+
+def _upsert_insert(db: Session):
+    """The dialect's insert() construct with ON CONFLICT support, or None."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert
+
+
+def _user_upsert(dialect_insert, rows: list[dict]):
+    """INSERT ... ON CONFLICT (email) DO UPDATE for users.
+
+    The update is a no-op (email = excluded.email), so an existing patient keeps
+    its data, but the row is locked and visible to RETURNING. Rows without email
+    never conflict and are always inserted, as before.
+    """
+    stmt = dialect_insert(User).values(rows)
+    return stmt.on_conflict_do_update(index_elements=[User.email], set_={"email": stmt.excluded.email})
+
+
+def _find_or_add_user(
     db: Session,
     name: str,
     email: str | None = None,
@@ -15,17 +104,68 @@ def get_or_create_user(
         user = db.query(User).filter(User.email == email).first()
 
     if not user:
-        user = User(
-            name=name or "Paciente sin nombre",
-            email=email,
-            gender=gender,
-            phone_number=phone_number,
-        )
+        user = User(**_user_row(name, email, gender, phone_number))
         db.add(user)
-        db.flush()
     return user
 
 
+def get_or_create_user(
+    db: Session,
+    name: str,
+    email: str | None = None,
+    gender: str | None = None,
+    phone_number: str | None = None,
+) -> User:
+    """Return the patient with this email, creating it if needed, in a single statement.
+
+    Uses an atomic upsert on Postgres and SQLite, so concurrent requests for the
+    same email never collide on the unique constraint.
+    """
+    dialect_insert = _upsert_insert(db)
+    if dialect_insert is None:
+        user = _find_or_add_user(db, name, email, gender, phone_number)
+        if user.id is None:
+            db.flush()
+        return user
+
+    stmt = _user_upsert(dialect_insert, [_user_row(name, email, gender, phone_number)]).returning(User)
+    return db.scalars(stmt, execution_options={"populate_existing": True}).one()
+
+
+def get_or_create_users(db: Session, patients: list[dict]) -> list[User]:
+    """Bulk variant of get_or_create_user.
+
+    Patients with an email are upserted by one multi-row statement (sorted by
+    email so concurrent batches lock rows in the same order); patients without
+    one are added to the session and inserted with the rest of the batch.
+    """
+    dialect_insert = _upsert_insert(db)
+    rows_by_email: dict[str, dict] = {}
+    for p in patients:
+        if p.get("email"):
+            rows_by_email.setdefault(p["email"], _user_row(**p))
+
+    known: dict[str, User] = {}
+    if rows_by_email and dialect_insert is not None:
+        rows = [rows_by_email[email] for email in sorted(rows_by_email)]
+        stmt = _user_upsert(dialect_insert, rows).returning(User)
+        known = {u.email: u for u in db.scalars(stmt, execution_options={"populate_existing": True})}
+    elif rows_by_email:
+        known = {u.email: u for u in db.query(User).filter(User.email.in_(rows_by_email))}
+
+    users = []
+    for p in patients:
+        email = p.get("email")
+        user = known.get(email) if email else None
+        if user is None:
+            user = User(**_user_row(**p))
+            db.add(user)
+            if email:
+                known[email] = user
+        users.append(user)
+    return users
+
+
 def seed_default_diseases(db: Session) -> None:
     defaults = [
         ("DIAB", "Riesgo de Diabetes (modelo ML)", "Modelo basado en dataset Pima."),
@@ -36,7 +176,11 @@ def seed_default_diseases(db: Session) -> None:
         exists = db.query(Disease).filter(Disease.disease_code == code).first()
         if not exists:
             db.add(Disease(disease_code=code, name=name, description=desc))
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:  # another worker seeded them at the same time
+        db.rollback()
+    disease_registry.load(db)
 
 
 def create_diagnosis_with_single_candidate(
@@ -46,86 +190,403 @@ def create_diagnosis_with_single_candidate(
     probability: float,
     final_description: str,
 ) -> Diagnosis:
-    disease = db.query(Disease).filter(Disease.disease_code == disease_code).first()
-    if not disease:
-        raise ValueError(f"Disease with code {disease_code} not found")
+    disease_id = disease_registry.get_id(db, disease_code)
 
-    diagnosis = Diagnosis(user_id=user_id, final_description=final_description, status="pending")
+    diagnosis = Diagnosis(
+        user_id=user_id,
+        final_description=final_description,
+        status="pending",
+        details=[DiagnosisDetail(disease_id=disease_id, probability=validate_probability(probability))],
+    )
     db.add(diagnosis)
-    db.flush()
+    return diagnosis
+
 
-    detail = DiagnosisDetail(
-        diagnosis_id=diagnosis.id,
-        disease_id=disease.id,
-        probability=validate_probability(probability),
+def create_patient_diagnosis(
+    db: Session,
+    name: str,
+    email: str | None,
+    gender: str | None,
+    phone_number: str | None,
+    disease_code: str,
+    probability: float,
+    final_description: str,
+    model_version: str | None = None,
+) -> None:
+    """Write the patient (when new), the diagnosis and its detail; see create_patient_panel."""
+    create_patient_panel(
+        db,
+        name=name,
+        email=email,
+        gender=gender,
+        phone_number=phone_number,
+        results=[(disease_code, probability, model_version)],
+        final_description=final_description,
     )
-    db.add(detail)
-    return diagnosis
 
 
-def get_recent_diagnoses(db: Session, limit: int = 50):
-    query = (
-        db.query(
-            Diagnosis.id,
-            Diagnosis.generated_at,
-            Diagnosis.status,
-            Diagnosis.final_description,
-            User.name.label("user_name"),
-            User.email.label("user_email"),
-            Disease.name.label("disease_name"),
-            Disease.disease_code,
-            DiagnosisDetail.probability,
+def create_patient_panel(
+    db: Session,
+    name: str,
+    email: str | None,
+    gender: str | None,
+    phone_number: str | None,
+    results: list[tuple[str, float, str | None]],
+    final_description: str,
+) -> None:
+    """Write the patient (when new) and one diagnosis with a detail per
+    (disease_code, probability, model_version), in as few round trips as possible.
+
+    On Postgres the user upsert and all inserts are chained through
+    data-modifying CTEs into a single statement. On SQLite the user upsert
+    returns the id and the diagnosis with its details is inserted by the flush
+    at commit time. Other dialects fall back to select-then-insert through ORM
+    relationships. The caller commits.
+    """
+    detail_rows = [
+        (disease_registry.get_id(db, disease_code), validate_probability(probability), model_version)
+        for disease_code, probability, model_version in results
+    ]
+
+    dialect_insert = _upsert_insert(db)
+    row = _user_row(name, email, gender, phone_number)
+
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(_patient_diagnosis_cte(dialect_insert, row, detail_rows, final_description))
+        return
+
+    details = [
+        DiagnosisDetail(disease_id=disease_id, probability=probability, model_version=model_version)
+        for disease_id, probability, model_version in detail_rows
+    ]
+    if dialect_insert is not None:
+        user_id = db.scalar(_user_upsert(dialect_insert, [row]).returning(User.id))
+        db.add(Diagnosis(user_id=user_id, final_description=final_description, status="pending", details=details))
+    else:
+        user = _find_or_add_user(db, **row)
+        db.add(Diagnosis(user=user, final_description=final_description, status="pending", details=details))
+
+
+def _patient_diagnosis_cte(
+    dialect_insert,
+    user_row: dict,
+    detail_rows: list[tuple[int, float, str | None]],
+    final_description: str,
+):
+    """Upsert user / insert diagnosis / insert its details as one Postgres statement."""
+    patient = _user_upsert(dialect_insert, [user_row]).returning(User.id).cte("patient")
+    new_diagnosis = (
+        insert(Diagnosis)
+        .from_select(
+            ["user_id", "final_description", "status"],
+            select(patient.c.id, literal(final_description), literal("pending")),
         )
-        .join(User, Diagnosis.user_id == User.id)
-        .join(DiagnosisDetail, DiagnosisDetail.diagnosis_id == Diagnosis.id)
-        .join(Disease, DiagnosisDetail.disease_id == Disease.id)
-        .order_by(Diagnosis.generated_at.desc())
-        .limit(limit)
+        .returning(Diagnosis.id)
+        .cte("new_diagnosis")
     )
-    return query.all()
-
-
-def get_diagnoses_by_user_email(db: Session, email: str, limit: int = 50):
-    query = (
-        db.query(
-            Diagnosis.id,
-            Diagnosis.generated_at,
-            Diagnosis.status,
-            Diagnosis.final_description,
-            User.name.label("user_name"),
-            User.email.label("user_email"),
-            Disease.name.label("disease_name"),
-            Disease.disease_code,
-            DiagnosisDetail.probability,
+    details = [
+        select(
+            new_diagnosis.c.id,
+            literal(disease_id),
+            literal(probability, DiagnosisDetail.probability.type),
+            literal(model_version, DiagnosisDetail.model_version.type),
         )
-        .join(User, Diagnosis.user_id == User.id)
-        .join(DiagnosisDetail, DiagnosisDetail.diagnosis_id == Diagnosis.id)
-        .join(Disease, DiagnosisDetail.disease_id == Disease.id)
-        .filter(User.email == email)
-        .order_by(Diagnosis.generated_at.desc())
-        .limit(limit)
+        for disease_id, probability, model_version in detail_rows
+    ]
+    return insert(DiagnosisDetail).from_select(
+        ["diagnosis_id", "disease_id", "probability", "model_version"],
+        details[0] if len(details) == 1 else union_all(*details),
     )
-    return query.all()
-
-
-def get_diagnoses_by_user_name(db: Session, name: str, limit: int = 50):
-    query = (
-        db.query(
-            Diagnosis.id,
-            Diagnosis.generated_at,
-            Diagnosis.status,
-            Diagnosis.final_description,
-            User.name.label("user_name"),
-            User.email.label("user_email"),
-            Disease.name.label("disease_name"),
-            Disease.disease_code,
-            DiagnosisDetail.probability,
+
+
+def create_diagnoses_bulk(
+    db: Session,
+    users: list[User],
+    disease_code: str,
+    results: list[tuple[float, str]],
+    model_version: str | None = None,
+) -> list[Diagnosis]:
+    """Add one single-candidate diagnosis per (user, (probability, description)) pair.
+
+    Details are attached through the relationship cascade, so the whole batch is
+    written by a single flush instead of one flush per diagnosis.
+    """
+    disease_id = disease_registry.get_id(db, disease_code)
+
+    diagnoses = [
+        Diagnosis(
+            user=user,
+            final_description=final_description,
+            status="pending",
+            details=[
+                DiagnosisDetail(
+                    disease_id=disease_id,
+                    probability=validate_probability(probability),
+                    model_version=model_version,
+                )
+            ],
+        )
+        for user, (probability, final_description) in zip(users, results)
+    ]
+    db.add_all(diagnoses)
+    return diagnoses
+
+
+def create_diagnoses_from_records(db: Session, records: list[dict]) -> int:
+    """Write journaled predictions (see app.utils.journal); returns how many were new.
+
+    Each record carries patient, disease_code, probability, final_description,
+    model_version and a unique external_ref; a panel record has a list of
+    {disease_code, probability, model_version} under "details" instead. Records
+    whose external_ref is already stored are skipped, so replaying a batch
+    after a crash does not duplicate diagnoses. The caller commits.
+    """
+    refs = [r["external_ref"] for r in records]
+    stored = set(db.scalars(select(Diagnosis.external_ref).where(Diagnosis.external_ref.in_(refs))))
+    records = [r for r in records if r["external_ref"] not in stored]
+    if not records:
+        return 0
+
+    users = get_or_create_users(db, [r["patient"] for r in records])
+    db.add_all(
+        Diagnosis(
+            user=user,
+            final_description=r["final_description"],
+            status="pending",
+            external_ref=r["external_ref"],
+            details=[
+                DiagnosisDetail(
+                    disease_id=disease_registry.get_id(db, d["disease_code"]),
+                    probability=validate_probability(d["probability"]),
+                    model_version=d.get("model_version"),
+                )
+                for d in r.get("details", [r])
+            ],
+        )
+        for user, r in zip(users, records)
+    )
+    return len(records)
+
+
+_COPY_STAGE = """
+CREATE TEMP TABLE IF NOT EXISTS diagnosis_stage (
+    external_ref TEXT NOT NULL,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    disease_id INTEGER NOT NULL,
+    probability NUMERIC NOT NULL,
+    final_description TEXT,
+    model_version TEXT
+) ON COMMIT DELETE ROWS
+"""
+
+_COPY_USERS = """
+INSERT INTO users (name, email)
+SELECT DISTINCT ON (email) name, email FROM diagnosis_stage ORDER BY email
+ON CONFLICT (email) DO NOTHING
+"""
+
+_COPY_DIAGNOSES = """
+INSERT INTO diagnoses (user_id, final_description, status, external_ref)
+SELECT u.id, s.final_description, 'pending', s.external_ref
+FROM diagnosis_stage s JOIN users u ON u.email = s.email
+ON CONFLICT (external_ref) DO NOTHING
+"""
+
+_COPY_DETAILS = """
+INSERT INTO diagnosis_details (diagnosis_id, disease_id, probability, model_version)
+SELECT d.id, s.disease_id, s.probability, s.model_version
+FROM diagnosis_stage s JOIN diagnoses d ON d.external_ref = s.external_ref
+ON CONFLICT (diagnosis_id, disease_id) DO NOTHING
+"""
+
+
+def copy_diagnoses_from_records(db: Session, records: list[dict]) -> int:
+    """create_diagnoses_from_records for bulk loads of single-disease records; returns how many were new.
+
+    On Postgres the records are streamed with COPY into a temporary staging
+    table and applied by three set-based INSERTs (users, diagnoses, details)
+    that skip what is already stored, so reloading the same records is a
+    no-op. Patients without email cannot be matched back to their new user row
+    and, like every record on other dialects, go through
+    create_diagnoses_from_records. The caller commits.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return create_diagnoses_from_records(db, records)
+
+    without_email = [r for r in records if not r["patient"].get("email")]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for r in records:
+        if r["patient"].get("email"):
+            row = _user_row(r["patient"].get("name"), r["patient"]["email"])
+            writer.writerow((
+                r["external_ref"],
+                row["name"],
+                row["email"],
+                disease_registry.get_id(db, r["disease_code"]),
+                validate_probability(r["probability"]),
+                r["final_description"],
+                r.get("model_version"),
+            ))
+    buffer.seek(0)
+
+    db.execute(text(_COPY_STAGE))
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert("COPY diagnosis_stage FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+    db.execute(text(_COPY_USERS))
+    inserted = db.execute(text(_COPY_DIAGNOSES)).rowcount
+    db.execute(text(_COPY_DETAILS))
+    if without_email:
+        inserted += create_diagnoses_from_records(db, without_email)
+    return inserted
+
+
+def encode_cursor(generated_at, diagnosis_id: int) -> str:
+    """Opaque keyset cursor for the (generated_at, id) position of a diagnosis."""
+    if isinstance(generated_at, datetime):
+        generated_at = generated_at.isoformat()
+    raw = json.dumps([generated_at, diagnosis_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(db: Session, cursor: str) -> tuple:
+    """Inverse of encode_cursor, with the timestamp ready to bind for this dialect."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        generated_at, diagnosis_id = json.loads(base64.urlsafe_b64decode(padded))
+        diagnosis_id = int(diagnosis_id)
+        if _is_sqlite(db):
+            return str(generated_at), diagnosis_id
+        return datetime.fromisoformat(generated_at), diagnosis_id
+    except (ValueError, TypeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def next_cursor(rows: list, limit: int) -> str | None:
+    """Cursor for the page after rows, or None when rows was the last page."""
+    if len({r.id for r in rows}) < limit:
+        return None
+    last = rows[-1]
+    return encode_cursor(last.cursor_generated_at, last.id)
+
+
+def _is_sqlite(db: Session) -> bool:
+    return db.get_bind().dialect.name == "sqlite"
+
+
+HISTORY_COLUMNS = (
+    Diagnosis.id,
+    Diagnosis.generated_at,
+    Diagnosis.status,
+    Diagnosis.final_description,
+    User.name.label("user_name"),
+    User.email.label("user_email"),
+    Disease.name.label("disease_name"),
+    Disease.disease_code,
+    DiagnosisDetail.probability,
+    DiagnosisDetail.model_version,
+)
+
+# History filter -> criterion on a bound parameter. disease_code is bound as the
+# disease id resolved through the registry.
+HISTORY_FILTERS = {
+    "name": lambda: func.lower(User.name) == func.lower(bindparam("name")),
+    "email": lambda: User.email == bindparam("email"),
+    "disease_code": lambda: DiagnosisDetail.disease_id == bindparam("disease_id"),
+    "status": lambda: Diagnosis.status == bindparam("status"),
+    "date_from": lambda: Diagnosis.generated_at >= bindparam("date_from"),
+    "date_to": lambda: Diagnosis.generated_at < bindparam("date_to"),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _history_statement(dialect: str, filters: frozenset, paged: bool, keyset: bool):
+    """The history select for one combination of filters, built once per process.
+
+    Every value is a bound parameter, so repeated calls reuse the same statement
+    object: its cache key is memoized and SQLAlchemy's compiled cache returns the
+    compiled SQL without rebuilding or recompiling the query.
+
+    A paged statement picks the page of diagnosis ids first, from the history
+    indexes and by keyset on (generated_at, id) instead of OFFSET, so a deep page
+    costs the same as the first one; their details are joined afterwards, so a
+    diagnosis is never split across pages and :limit counts diagnoses.
+    """
+    criteria = [HISTORY_FILTERS[name]() for name in sorted(filters)]
+    newest_first = (Diagnosis.generated_at.desc(), Diagnosis.id.desc())
+    query = select(*HISTORY_COLUMNS).select_from(Diagnosis)
+
+    if paged:
+        page = select(Diagnosis.id)
+        if filters & {"name", "email"}:
+            page = page.join(User, Diagnosis.user_id == User.id)
+        if "disease_code" in filters:
+            page = page.join(DiagnosisDetail, DiagnosisDetail.diagnosis_id == Diagnosis.id)
+        page = page.where(*criteria)
+        if keyset:
+            # SQLite keeps DATETIME as text, and rows written by CURRENT_TIMESTAMP and
+            # by SQLAlchemy use different formats; comparing the raw text keeps ties exact.
+            cursor_type = Text() if dialect == "sqlite" else Diagnosis.generated_at.type
+            page = page.where(
+                tuple_(Diagnosis.generated_at, Diagnosis.id)
+                < tuple_(bindparam("cursor_at", type_=cursor_type), bindparam("cursor_id"))
+            )
+        page = page.order_by(*newest_first).limit(bindparam("limit")).subquery()
+
+        cursor_column = cast(Diagnosis.generated_at, Text) if dialect == "sqlite" else Diagnosis.generated_at
+        query = (
+            select(*HISTORY_COLUMNS, cursor_column.label("cursor_generated_at"))
+            .select_from(Diagnosis)
+            .join(page, page.c.id == Diagnosis.id)
         )
-        .join(User, Diagnosis.user_id == User.id)
+        criteria = [HISTORY_FILTERS["disease_code"]()] if "disease_code" in filters else []
+
+    return (
+        query.join(User, Diagnosis.user_id == User.id)
         .join(DiagnosisDetail, DiagnosisDetail.diagnosis_id == Diagnosis.id)
         .join(Disease, DiagnosisDetail.disease_id == Disease.id)
-        .filter(User.name == name)
-        .order_by(Diagnosis.generated_at.desc())
-        .limit(limit)
+        .where(*criteria)
+        .order_by(*newest_first, DiagnosisDetail.id)
     )
-    return query.all()
+
+
+def _history_params(db: Session, filters: dict) -> tuple[frozenset, dict]:
+    unknown = set(filters) - HISTORY_FILTERS.keys()
+    if unknown:
+        raise TypeError(f"Unknown history filters: {', '.join(sorted(unknown))}")
+    params = {name: value for name, value in filters.items() if value not in (None, "")}
+    active = frozenset(params)
+    if "disease_code" in params:
+        params["disease_id"] = disease_registry.get_id(db, params.pop("disease_code"))
+    return active, params
+
+
+def get_diagnosis_history(db: Session, limit: int = 50, cursor: str | None = None, **filters):
+    """One page of diagnosis history, newest first.
+
+    filters is any combination of name (case-insensitive), email, disease_code,
+    status, date_from (inclusive) and date_to (exclusive); None or empty values
+    are ignored. With disease_code only that disease's detail rows are returned.
+    """
+    active, params = _history_params(db, filters)
+    params["limit"] = limit
+    if cursor:
+        params["cursor_at"], params["cursor_id"] = decode_cursor(db, cursor)
+    statement = _history_statement(db.get_bind().dialect.name, active, True, bool(cursor))
+    return db.execute(statement, params).all()
+
+
+def iter_diagnoses(db: Session, batch_size: int = 1000, **filters):
+    """Every history row matching filters (see get_diagnosis_history), newest first.
+
+    yield_per turns on stream_results, so PostgreSQL serves the rows from a
+    server-side cursor and only batch_size rows are held in memory however large
+    the export is. The caller keeps the session open until iteration ends.
+    """
+    active, params = _history_params(db, filters)
+    statement = _history_statement(db.get_bind().dialect.name, active, False, False)
+    return db.execute(statement, params, execution_options={"yield_per": batch_size})
@@ -1,19 +1,129 @@
 # Database configuration and session setup
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 
+from app.utils.pool import instrumented_pool, track_pool
+
 # Load environment variables from .env if present
 load_dotenv()
 
 # Use SQLite by default for local dev; override with Postgres via env
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./meddiag.db")
 
-if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# DB_ASYNC=1 serves requests with AsyncSession (aiosqlite / asyncpg) instead of
+# sync sessions on the threadpool. The sync engine is still used for startup tasks.
+DB_ASYNC = os.getenv("DB_ASYNC", "0") == "1"
+
+
+def _async_url(url: str) -> str:
+    """Map a sync DATABASE_URL to the matching async driver."""
+    scheme, sep, rest = url.partition("://")
+    backend = scheme.split("+", 1)[0]
+    if backend == "sqlite":
+        return f"sqlite+aiosqlite{sep}{rest}"
+    if backend in ("postgresql", "postgres"):
+        return f"postgresql+asyncpg{sep}{rest}"
+    raise ValueError(f"No async driver configured for {scheme}")
+
+
+# Pool sizing, shared by the sync and async engines (per worker process)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Replace connections older than this many seconds, before the server or a proxy drops them idle
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Test each connection with a cheap ping on checkout and reconnect if it went stale
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    return url.startswith("sqlite") and (":memory:" in url or url.endswith("://"))
+
+
+def _pool_options(url: str, poolclass) -> dict:
+    """create_engine pool arguments for url, with checkouts timed by poolclass."""
+    if _is_memory_sqlite(url):
+        return {}  # in-memory SQLite lives in a single connection, nothing to size
+    return {
+        "poolclass": instrumented_pool(poolclass),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+# SQLite profile, applied to every connection. WAL lets readers run while a write
+# is in progress; synchronous=NORMAL is durable across application crashes and
+# only fsyncs at checkpoints; busy_timeout waits for the write lock instead of
+# failing at once with "database is locked".
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+# SQLITE_SINGLE_WRITER=1 sends diagnosis writes through one group-committing
+# writer thread (file databases only; an in-memory one is private to its connection)
+SQLITE_SINGLE_WRITER = (
+    IS_SQLITE and not _is_memory_sqlite(DATABASE_URL) and os.getenv("SQLITE_SINGLE_WRITER", "1") == "1"
+)
+SQLITE_WRITER_MAX_BATCH = int(os.getenv("SQLITE_WRITER_MAX_BATCH", "256"))
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    # negative cache_size is in KiB rather than pages
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.close()
+
+
+if IS_SQLITE:
+    engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        **_pool_options(DATABASE_URL, QueuePool),
+    )
+    event.listen(engine, "connect", _apply_sqlite_pragmas)
 else:
-    engine = create_engine(DATABASE_URL)
+    engine = create_engine(DATABASE_URL, **_pool_options(DATABASE_URL, QueuePool))
+track_pool(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
+
+async_engine = None
+AsyncSessionLocal = None
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", _async_url(DATABASE_URL))
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL, **_pool_options(ASYNC_DATABASE_URL, AsyncAdaptedQueuePool)
+    )
+    track_pool(async_engine.sync_engine)
+    if ASYNC_DATABASE_URL.startswith("sqlite"):
+        event.listen(async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autocommit=False, autoflush=False)
+
+
+async def run_db(db, fn, *args, **kwargs):
+    """Run fn(session, *args, **kwargs) without blocking the event loop.
+
+    fn is ordinary sync code written against Session (e.g. the crud helpers).
+    With an AsyncSession it runs through run_sync; with a sync Session it runs
+    on the threadpool, so both modes share the same crud API.
+    """
+    if hasattr(db, "run_sync"):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
@@ -0,0 +1,226 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Tuple, Type
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single process drains
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending_writes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payload TEXT NOT NULL,
+    enqueued_at REAL NOT NULL
+)
+"""
+
+_DEAD_LETTER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dead_letters (
+    id INTEGER PRIMARY KEY,
+    payload TEXT NOT NULL,
+    enqueued_at REAL NOT NULL,
+    failed_at REAL NOT NULL,
+    error TEXT NOT NULL
+)
+"""
+
+
+class WriteBehindJournal:
+    """Durable local queue of records waiting to be written to the main database.
+
+    append() stores records in a SQLite file (WAL) and returns as soon as they
+    are committed there, so a request does not wait for the main database. A
+    daemon thread wakes every interval_ms (or right away while full batches are
+    waiting) and drains the journal in batches of up to batch_size through
+    apply_fn(records), which must be idempotent: a record is deleted from the
+    journal only after apply_fn has committed it, so a crash in between replays
+    it on the next start. Whatever is left in the journal at startup is
+    drained first, in order.
+
+    A batch that fails with one of the `retryable` exceptions (the main
+    database is down or busy) stays at the head of the journal and is retried
+    on the next pass. Any other error means some record can never be applied:
+    the batch is split in halves until the failing records are isolated, and
+    those are moved to the dead_letters table of the journal with their error
+    while the rest of the batch is written.
+
+    With synchronous=FULL (the default) a record survives a power loss once
+    append() returns; NORMAL is faster but, in WAL mode, may lose the last
+    appends.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        apply_fn: Callable[[List[dict]], None],
+        batch_size: int = 500,
+        interval_ms: int = 200,
+        synchronous: str = "FULL",
+        retryable: Tuple[Type[BaseException], ...] = (ConnectionError, TimeoutError),
+    ):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self.path = path
+        self.apply_fn = apply_fn
+        self.batch_size = batch_size
+        self.interval_ms = interval_ms
+        self.synchronous = synchronous
+        self.retryable = retryable
+
+        self._conn = self._connect()
+        self._drain_lock = self._open_drain_lock()
+        self._lock = threading.Lock()
+
+        self._stopping = threading.Event()
+        self._thread = None
+
+        self._drained = 0
+        self._batches = 0
+        self._failures = 0
+        self._dead_lettered = 0
+        self._last_error = None
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute(_SCHEMA)
+        conn.execute(_DEAD_LETTER_SCHEMA)
+        return conn
+
+    def _open_drain_lock(self):
+        if fcntl is None:
+            return None
+        return os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+
+    def reopen(self) -> None:
+        """Open this process's own connection and drain lock after a fork.
+
+        SQLite connections must not cross a fork, and a flock is shared by
+        every copy of the descriptor that took it.
+        """
+        self._conn = self._connect()
+        if self._drain_lock is not None:
+            os.close(self._drain_lock)
+        self._drain_lock = self._open_drain_lock()
+        self._lock = threading.Lock()
+
+    def append(self, records: List[dict]) -> None:
+        """Persist records to the journal in one local transaction."""
+        now = time.time()
+        rows = [(json.dumps(record), now) for record in records]
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany("INSERT INTO pending_writes (payload, enqueued_at) VALUES (?, ?)", rows)
+
+    def start(self) -> None:
+        if self._thread is None:
+            # a previous close() left the event set; the new thread would exit after one pass
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def close(self, timeout: float | None = 10.0) -> None:
+        """Stop the drain thread after one last pass; the remainder stays for the next start."""
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            depth, oldest = self._conn.execute("SELECT count(*), min(enqueued_at) FROM pending_writes").fetchone()
+            dead_letters = self._conn.execute("SELECT count(*) FROM dead_letters").fetchone()[0]
+        return {
+            "depth": depth,
+            "lag_seconds": time.time() - oldest if oldest is not None else 0.0,
+            "drained": self._drained,
+            "batches": self._batches,
+            "failures": self._failures,
+            "dead_lettered": self._dead_lettered,
+            "dead_letters": dead_letters,
+            "last_error": self._last_error,
+        }
+
+    def drain_once(self) -> int:
+        """Apply and remove the oldest batch; returns how many records it held.
+
+        When several processes (web workers) share the journal, only the one
+        holding the drain lock drains; the others return 0 and retry later.
+        """
+        if self._drain_lock is None:
+            return self._drain_batch()
+        try:
+            fcntl.flock(self._drain_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return 0
+        try:
+            return self._drain_batch()
+        finally:
+            fcntl.flock(self._drain_lock, fcntl.LOCK_UN)
+
+    def _drain_batch(self) -> int:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, payload, enqueued_at FROM pending_writes ORDER BY id LIMIT ?", (self.batch_size,)
+            ).fetchall()
+        if not rows:
+            return 0
+        dead = self._apply(rows)
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO dead_letters (id, payload, enqueued_at, failed_at, error) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(*row, now, error) for row, error in dead],
+                )
+                self._conn.execute("DELETE FROM pending_writes WHERE id <= ?", (rows[-1][0],))
+        self._drained += len(rows) - len(dead)
+        self._dead_lettered += len(dead)
+        self._batches += 1
+        return len(rows)
+
+    def _apply(self, rows: list) -> list:
+        """apply_fn the journal rows; returns [(row, error)] for those that can never be applied.
+
+        Retryable errors propagate, leaving the whole batch in the journal
+        (apply_fn is idempotent, so the parts already written are skipped on
+        the retry).
+        """
+        try:
+            self.apply_fn([json.loads(payload) for _, payload, _ in rows])
+            return []
+        except self.retryable:
+            raise
+        except Exception as exc:
+            if len(rows) == 1:
+                logger.error("Write-behind record %d moved to dead_letters: %r", rows[0][0], exc)
+                return [(rows[0], repr(exc))]
+        middle = len(rows) // 2
+        return self._apply(rows[:middle]) + self._apply(rows[middle:])
+
+    def _run(self) -> None:
+        while True:
+            try:
+                drained = self.drain_once()
+            except Exception as exc:  # main database unavailable: keep the records and retry
+                self._failures += 1
+                self._last_error = repr(exc)
+                logger.warning("Write-behind drain failed, retrying: %r", exc)
+                drained = 0
+            if self._stopping.is_set() and not drained:
+                return
+            if drained < self.batch_size:
+                # sleeping between drains lets writes pile up into one transaction
+                self._stopping.wait(self.interval_ms / 1000)
@@ -0,0 +1,100 @@
+# Versioned schema migrations for databases created before a schema change
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, Text, func, insert, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateIndex
+
+from app.models import Diagnosis, DiagnosisDetail, User
+
+# create_all() builds new databases with the current schema (including the
+# indexes declared in app/models.py). Each migration below brings an existing
+# database up to date; applied versions are recorded so every one runs once.
+_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", Text, nullable=False),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
+)
+
+# Arbitrary key for pg_advisory_xact_lock, so concurrent workers migrate one at a time
+_PG_LOCK_KEY = 4210009
+
+
+def _create_indexes(*indexes) -> Callable[[Connection], None]:
+    # IF NOT EXISTS rather than checkfirst: SQLite cannot reflect expression indexes
+    def migrate(conn: Connection) -> None:
+        for index in indexes:
+            conn.execute(CreateIndex(index, if_not_exists=True))
+
+    return migrate
+
+
+def _add_column(table, column_name: str) -> Callable[[Connection], None]:
+    # create_all() already built the column on databases created after the change
+    def migrate(conn: Connection) -> None:
+        existing = {c["name"] for c in inspect(conn).get_columns(table.name)}
+        if column_name in existing:
+            return
+        column = table.c[column_name]
+        column_type = column.type.compile(dialect=conn.dialect)
+        conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column_name} {column_type}"))
+
+    return migrate
+
+
+def _steps(*steps: Callable[[Connection], None]) -> Callable[[Connection], None]:
+    def migrate(conn: Connection) -> None:
+        for step in steps:
+            step(conn)
+
+    return migrate
+
+
+def _index(table, name: str):
+    return next(i for i in table.indexes if i.name == name)
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (
+        1,
+        "History indexes: users lower(name), diagnoses (generated_at) and (user_id, generated_at)",
+        _create_indexes(
+            _index(User.__table__, "ix_users_name_lower"),
+            _index(Diagnosis.__table__, "ix_diagnoses_generated_at"),
+            _index(Diagnosis.__table__, "ix_diagnoses_user_id_generated_at"),
+        ),
+    ),
+    (
+        2,
+        "Write-behind idempotency: diagnoses.external_ref with a unique index",
+        _steps(
+            _add_column(Diagnosis.__table__, "external_ref"),
+            _create_indexes(_index(Diagnosis.__table__, "ux_diagnoses_external_ref")),
+        ),
+    ),
+    (
+        3,
+        "Model provenance: diagnosis_details.model_version",
+        _add_column(DiagnosisDetail.__table__, "model_version"),
+    ),
+]
+
+
+def run_migrations(engine: Engine) -> List[int]:
+    """Apply pending migrations in order and return the versions applied."""
+    applied_now = []
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _PG_LOCK_KEY})
+        schema_migrations.create(conn, checkfirst=True)
+        applied = set(conn.scalars(select(schema_migrations.c.version)))
+        for version, description, migrate in MIGRATIONS:
+            if version in applied:
+                continue
+            migrate(conn)
+            conn.execute(insert(schema_migrations).values(version=version, description=description))
+            applied_now.append(version)
+    return applied_now
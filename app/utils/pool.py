@@ -0,0 +1,104 @@
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+
+class PoolStats:
+    """Counters for one engine's connection pool, shared by every pool it recreates."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_count = 0
+        self.wait_seconds = 0.0
+        self.wait_max_seconds = 0.0
+
+    def record_wait(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            self.wait_count += 1
+            self.wait_seconds += seconds
+            self.wait_max_seconds = max(self.wait_max_seconds, seconds)
+            self.timeouts += timed_out
+
+    def increment(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": self.wait_seconds / self.wait_count * 1000.0 if self.wait_count else 0.0,
+                "wait_max_ms": self.wait_max_seconds * 1000.0,
+                "wait_total_ms": self.wait_seconds * 1000.0,
+            }
+
+
+def instrumented_pool(poolclass):
+    """Subclass of poolclass that times every checkout from the queue.
+
+    The time spent in _do_get covers both waiting for a free connection and
+    opening a new one when the pool may still overflow. The stats object is a
+    class attribute so it survives pool.recreate() after dispose or a
+    disconnect.
+    """
+
+    class InstrumentedPool(poolclass):
+        pool_stats = PoolStats()
+
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except PoolTimeoutError:
+                self.pool_stats.record_wait(time.perf_counter() - started, timed_out=True)
+                raise
+            self.pool_stats.record_wait(time.perf_counter() - started)
+            return connection
+
+    InstrumentedPool.__name__ = f"Instrumented{poolclass.__name__}"
+    return InstrumentedPool
+
+
+def track_pool(engine) -> None:
+    """Count checkouts, new connections and invalidations of an instrumented engine."""
+    stats = getattr(engine.pool, "pool_stats", None)
+    if stats is None:
+        return
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        stats.increment("checkouts")
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        stats.increment("connects")
+
+    @event.listens_for(engine, "invalidate")
+    @event.listens_for(engine, "soft_invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        stats.increment("invalidations")
+
+
+def pool_stats(engine) -> dict | None:
+    """Counters plus the current size, checked-out and overflow of engine's pool."""
+    pool = engine.pool
+    stats = getattr(pool, "pool_stats", None)
+    if stats is None:
+        return None
+    return {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        **stats.snapshot(),
+    }
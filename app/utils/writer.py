@@ -0,0 +1,143 @@
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable, Tuple
+
+from sqlalchemy.orm import Session
+
+WriteJob = Tuple[Callable, tuple, Future]
+
+_STOP = object()
+
+
+class SingleWriter:
+    """Serializes writes on one thread and group-commits them.
+
+    submit(fn, *args) queues fn(session, *args); the writer thread takes every
+    job waiting in the queue (up to max_batch_size), runs them in one session
+    and commits once, so N concurrent requests cost one transaction instead of
+    N transactions racing for SQLite's write lock. Jobs must not commit
+    themselves and should return plain values, not ORM objects.
+
+    If any job in a group fails the group is rolled back and its jobs are
+    replayed one transaction each, so only the failing job sees the error.
+
+    The thread starts with start() or the first submit(). After close(),
+    submit() raises until start() is called again.
+    """
+
+    def __init__(self, name: str, session_factory: Callable[[], Session], max_batch_size: int = 256):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.name = name
+        self.session_factory = session_factory
+        self.max_batch_size = max_batch_size
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = None
+        self._closed = False
+        self._start_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._writes = 0
+        self._groups = 0
+        self._replayed = 0
+        self._failed = 0
+
+    def start(self) -> None:
+        """Start the writer thread, also after close()."""
+        with self._start_lock:
+            self._closed = False
+            self._start_locked()
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Queue fn(session, *args); the future resolves once its group is committed."""
+        future: Future = Future()
+        with self._start_lock:
+            if self._closed:
+                raise RuntimeError(f"Writer {self.name} is closed")
+            self._start_locked()
+            # under the lock, so nothing is queued behind the stop marker of close()
+            self._queue.put((fn, args, future))
+        return future
+
+    def close(self, timeout: float | None = None) -> None:
+        """Commit what is already queued, then stop the writer thread."""
+        with self._start_lock:
+            self._closed = True
+            thread = self._thread
+            if thread is None:
+                return
+            self._queue.put(_STOP)
+        thread.join(timeout)
+        with self._start_lock:
+            if self._thread is thread:
+                self._thread = None
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            writes, groups = self._writes, self._groups
+            replayed, failed = self._replayed, self._failed
+        return {
+            "max_batch_size": self.max_batch_size,
+            "writes": writes,
+            "groups": groups,
+            "avg_group_size": writes / groups if groups else 0.0,
+            "replayed": replayed,
+            "failed": failed,
+            "queue_depth": self._queue.qsize(),
+        }
+
+    def _start_locked(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            thread = threading.Thread(target=self._run, name=f"writer-{self.name}", daemon=True)
+            thread.start()
+            self._thread = thread
+
+    def _collect(self) -> Tuple[list, bool]:
+        jobs = [self._queue.get()]
+        while len(jobs) < self.max_batch_size:
+            try:
+                jobs.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        stop = any(job is _STOP for job in jobs)
+        return [job for job in jobs if job is not _STOP], stop
+
+    def _run(self) -> None:
+        while True:
+            jobs, stop = self._collect()
+            if jobs:
+                self._write_group(jobs)
+            if stop:
+                # drain whatever was queued behind the stop marker
+                while True:
+                    try:
+                        job = self._queue.get_nowait()
+                    except queue.Empty:
+                        return
+                    if job is not _STOP:
+                        self._write_group([job])
+
+    def _write_group(self, jobs: list) -> None:
+        try:
+            with self.session_factory() as db:
+                results = [fn(db, *args) for fn, args, _ in jobs]
+                db.commit()
+        except Exception as exc:
+            if len(jobs) == 1:
+                with self._stats_lock:
+                    self._failed += 1
+                jobs[0][2].set_exception(exc)
+                return
+            with self._stats_lock:
+                self._replayed += len(jobs)
+            for job in jobs:
+                self._write_group([job])
+            return
+
+        with self._stats_lock:
+            self._writes += len(jobs)
+            self._groups += 1
+        for (_, _, future), result in zip(jobs, results):
+            future.set_result(result)
@@ -0,0 +1,90 @@
+"""Peak Python memory of /diagnoses/export as the number of exported rows grows.
+
+Seeds a throwaway database with BENCH_DIAGNOSES diagnoses, then drains the
+export stream for growing prefixes of the history (via date_from) and reports
+the tracemalloc peak of each run. A streaming export keeps the peak flat.
+
+    BENCH_DATABASE_URL=postgresql+psycopg2://... python benchmarks/export_memory.py
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT_DIR)
+
+DEFAULT_URL = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'export.db')}"
+os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL", DEFAULT_URL)
+
+from sqlalchemy import insert  # noqa: E402
+
+from app.main import _export_chunks  # noqa: E402  (creates the tables)
+from app.models import Diagnosis, DiagnosisDetail, User  # noqa: E402
+from app.utils import crud  # noqa: E402
+from app.utils.database import SessionLocal  # noqa: E402
+
+DIAGNOSES = int(os.getenv("BENCH_DIAGNOSES", "200000"))
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def seed():
+    with SessionLocal() as db:
+        crud.seed_default_diseases(db)
+        if db.query(Diagnosis).count():
+            return
+        db.execute(insert(User), [{"name": "Auditoria", "email": "audit@bench.local"}])
+        user_id = db.query(User.id).scalar()
+        disease_id = crud.disease_registry.get_id(db, "DIAB")
+        for offset in range(0, DIAGNOSES, 10000):
+            ids = db.execute(
+                insert(Diagnosis).returning(Diagnosis.id),
+                [
+                    {
+                        "user_id": user_id,
+                        "generated_at": START + timedelta(seconds=i),
+                        "final_description": "bench",
+                    }
+                    for i in range(offset, min(offset + 10000, DIAGNOSES))
+                ],
+            ).scalars()
+            db.execute(
+                insert(DiagnosisDetail),
+                [{"diagnosis_id": d, "disease_id": disease_id, "probability": 0.5} for d in ids],
+            )
+        db.commit()
+
+
+def drain(export_format, rows):
+    filters = {
+        "name": None,
+        "email": None,
+        "date_from": START + timedelta(seconds=DIAGNOSES - rows),
+        "date_to": None,
+    }
+    started = time.perf_counter()
+    size = sum(len(chunk) for chunk in _export_chunks(export_format, filters))
+    elapsed = time.perf_counter() - started
+    # second pass for the peak, tracemalloc slows the first one down several times
+    tracemalloc.start()
+    for _ in _export_chunks(export_format, filters):
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{export_format:6s} rows={rows:7d} bytes={size:11d} "
+        f"peak_mb={peak / 2**20:6.2f} rows/s={rows / elapsed:9.0f}"
+    )
+
+
+def main():
+    seed()
+    for export_format in ("ndjson", "csv"):
+        for rows in (DIAGNOSES // 100, DIAGNOSES // 10, DIAGNOSES):
+            drain(export_format, rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Per-request cost of validating a payload and turning it into the scored row.
+
+Everything a prediction does before the model runs, from the parsed JSON body
+to the float64 array, for the widest model (Parkinson, 22 features):
+
+- dict:     the previous path: an untyped features dict, checked for missing
+            and non-numeric features, then converted again into a list of
+            floats and copied into np.array([values])
+- features: ParkinsonRequest with typed, range-checked features, written in
+            one pass into a row allocated at its final size
+- x:        ParkinsonRequest with the compact "x" payload (values in feature
+            order)
+- batch:    per row of a BATCH_ROWS batch, untyped dicts checked row by
+            row and converted by the previous comprehension into np.array,
+            vs _split_batch filling one preallocated matrix (features or x)
+            and range-checking it at once
+
+    python benchmarks/feature_vectorization.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT_DIR)
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'vectorize.db')}"
+
+from pydantic import BaseModel  # noqa: E402
+
+from app.features import PARKINSON  # noqa: E402
+from app.main import BatchRequest, Patient, ParkinsonRequest, _split_batch  # noqa: E402
+
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "20000"))
+BATCH_ROWS = int(os.getenv("BENCH_BATCH_ROWS", "500"))
+ORDER = PARKINSON.order
+
+PATIENT = {"name": "Bench", "email": "bench@bench.local"}
+VALUES = [float(v) for v in (PARKINSON.low + PARKINSON.high) / 2]
+FEATURES = dict(zip(ORDER, VALUES))
+
+
+class DictRequest(BaseModel):
+    patient: Patient
+    features: dict
+
+
+def check_dict(features: dict) -> None:
+    missing = [f for f in ORDER if f not in features]
+    if missing:
+        raise ValueError(f"Missing required features: {', '.join(missing)}")
+    for f in ORDER:
+        float(features[f])
+
+
+def dict_row(body: dict) -> np.ndarray:
+    features = DictRequest.model_validate(body).features
+    check_dict(features)
+    values = [float(features[f]) for f in ORDER]
+    return np.array([values])
+
+
+def dict_batch(body: dict) -> np.ndarray:
+    items = [item.features for item in BatchRequest.model_validate(body).items]
+    for features in items:
+        check_dict(features)
+    return np.array([[float(row[f]) for f in ORDER] for row in items], dtype=float)
+
+
+def typed_batch(body: dict) -> np.ndarray:
+    _, _, x = _split_batch(BatchRequest.model_validate(body).items, PARKINSON)
+    return x
+
+
+def measure(fn, body, rounds: int) -> float:
+    for _ in range(min(rounds, 200)):
+        fn(body)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn(body)
+    return (time.perf_counter() - started) / rounds * 1e6
+
+
+def main():
+    features_body = {"patient": PATIENT, "features": FEATURES}
+    x_body = {"patient": PATIENT, "x": VALUES}
+    batch_body = {"items": [{"patient": PATIENT, "features": FEATURES}] * BATCH_ROWS}
+    x_batch_body = {"items": [{"patient": PATIENT, "x": VALUES}] * BATCH_ROWS}
+
+    expected = dict_row(features_body)[0]
+    assert np.array_equal(ParkinsonRequest.model_validate(features_body).row(), expected)
+    assert np.array_equal(ParkinsonRequest.model_validate(x_body).row(), expected)
+    assert np.array_equal(typed_batch(batch_body), dict_batch(batch_body))
+
+    print(f"{len(ORDER)} features, {ROUNDS} requests, batches of {BATCH_ROWS}")
+    rows = (
+        ("dict", dict_row, features_body, 1),
+        ("features", lambda body: ParkinsonRequest.model_validate(body).row(), features_body, 1),
+        ("x", lambda body: ParkinsonRequest.model_validate(body).row(), x_body, 1),
+        ("batch dict", dict_batch, batch_body, BATCH_ROWS),
+        ("batch feat", typed_batch, batch_body, BATCH_ROWS),
+        ("batch x", typed_batch, x_batch_body, BATCH_ROWS),
+    )
+    for label, fn, body, per in rows:
+        per_row = measure(fn, body, max(ROUNDS // per, 20)) / per
+        print(f"{label:10s} {per_row:8.2f} us/row")
+
+
+if __name__ == "__main__":
+    main()
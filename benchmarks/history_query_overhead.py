@@ -0,0 +1,101 @@
+"""Python-side cost per /diagnoses/history query call.
+
+Runs the same one-page history query against a small throwaway database,
+so the time is dominated by SQLAlchemy rather than by the database:
+
+- uncached: statement rebuilt every call and compiled from scratch
+- rebuilt:  statement rebuilt every call; the compiled cache still hits, but
+            building it and generating its cache key is paid every time
+            (what the per-filter query functions used to do)
+- cached:   crud.get_diagnosis_history, reusing the prebuilt statement
+- dbapi:    the compiled SQL run straight on the DBAPI cursor, as a floor
+
+    BENCH_DATABASE_URL=postgresql+psycopg2://... python benchmarks/history_query_overhead.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT_DIR)
+
+DEFAULT_URL = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'overhead.db')}"
+os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL", DEFAULT_URL)
+
+from app.utils import crud  # noqa: E402
+from app.utils.database import Base, SessionLocal, engine  # noqa: E402
+
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "2000"))
+FILTERS = {"email": "bench@bench.local", "disease_code": "DIAB", "status": "pending"}
+
+
+def seed():
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        crud.seed_default_diseases(db)
+        users = crud.get_or_create_users(db, [{"name": "Bench", "email": FILTERS["email"]}])
+        crud.create_diagnoses_bulk(db, users * 20, "DIAB", [(0.5, "bench")] * 20)
+        db.commit()
+
+
+def statement_and_params(db):
+    active, params = crud._history_params(db, FILTERS)
+    params["limit"] = 10
+    return active, params
+
+
+def uncached(db, active, params):
+    statement = crud._history_statement.__wrapped__(engine.dialect.name, active, True, False)
+    db.execute(statement, params, execution_options={"compiled_cache": None}).all()
+
+
+def rebuilt(db, active, params):
+    statement = crud._history_statement.__wrapped__(engine.dialect.name, active, True, False)
+    db.execute(statement, params).all()
+
+
+def cached(db, active, params):
+    crud.get_diagnosis_history(db, 10, None, **FILTERS)
+
+
+def make_dbapi(db, active, params):
+    statement = crud._history_statement(engine.dialect.name, active, True, False)
+    compiled = statement.compile(dialect=engine.dialect)
+    sql = str(compiled)
+    bound = compiled.construct_params(params)
+    if compiled.positiontup:
+        bound = tuple(bound[name] for name in compiled.positiontup)
+
+    def dbapi(db, active, params):
+        cursor = db.connection().connection.cursor()
+        cursor.execute(sql, bound)
+        cursor.fetchall()
+        cursor.close()
+
+    return dbapi
+
+
+def measure(fn, db, active, params) -> float:
+    for _ in range(50):
+        fn(db, active, params)
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        fn(db, active, params)
+    return (time.perf_counter() - started) / ROUNDS * 1e6
+
+
+def main():
+    seed()
+    with SessionLocal() as db:
+        active, params = statement_and_params(db)
+        dbapi = make_dbapi(db, active, params)
+        print(f"{engine.dialect.name}, filters={sorted(FILTERS)}, {ROUNDS} calls each")
+        floor = measure(dbapi, db, active, params)
+        for label, fn in (("uncached", uncached), ("rebuilt", rebuilt), ("cached", cached), ("dbapi", dbapi)):
+            per_call = measure(fn, db, active, params)
+            print(f"{label:9s} {per_call:8.1f} us/call  orm_overhead={per_call - floor:8.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Import-time budget for the API's startup path.
+
+Runs `python -X importtime` in fresh interpreters that import app.main and
+load every model through the registry (what a worker does before serving its
+first prediction), then reports:
+
+- the median total import time over BENCH_RUNS runs
+- the top-level packages that cost the most in the median run (self time of
+  all their modules, so nothing is counted twice)
+- modules that must never be imported at startup (scikit-learn and friends),
+  e.g. because an exported model is missing or stale and the registry fell
+  back to the pickle (each run starts with an empty MODEL_CACHE_DIR)
+
+Exits with status 1 when the median exceeds IMPORT_BUDGET_MS or a forbidden
+module was imported, so CI can enforce it:
+
+    IMPORT_BUDGET_MS=1500 python benchmarks/import_time.py
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+RUNS = int(os.getenv("BENCH_RUNS", "5"))
+BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "1500"))
+FORBIDDEN = ("sklearn", "scipy", "joblib", "threadpoolctl", "pandas", "streamlit")
+TOP = 12
+
+STARTUP = "import app.main\nfrom app.model_predict import model_registry\nmodel_registry.load_all()\n"
+
+
+def run_once(env: dict) -> list:
+    """[(package, self_us, cumulative_us, depth)] from one -X importtime run."""
+    # an empty compile cache, as in a fresh container: only exported models avoid the pickle
+    env = {**env, "MODEL_CACHE_DIR": tempfile.mkdtemp()}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP],
+        cwd=ROOT_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        sys.exit(proc.stderr)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def main():
+    env = dict(os.environ)
+    env["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'import.db')}"
+    env["PYTHONPATH"] = ROOT_DIR
+    # measure what a deployed worker does: import from bytecode, not from source
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+
+    run_once(env)  # writes the bytecode, so every measured run starts alike
+    runs = []
+    for _ in range(RUNS):
+        rows = run_once(env)
+        total_us = sum(cumulative for _, _, cumulative, depth in rows if depth == 0)
+        runs.append((total_us, rows))
+    runs.sort(key=lambda run: run[0])
+    total_us, rows = runs[len(runs) // 2]
+
+    packages = {}
+    for name, self_us, _, _ in rows:
+        root = name.split(".")[0]
+        packages[root] = packages.get(root, 0) + self_us
+    print(f"startup imports: median {total_us / 1000:.0f} ms over {RUNS} runs "
+          f"(min {runs[0][0] / 1000:.0f}, max {runs[-1][0] / 1000:.0f}), budget {BUDGET_MS:.0f} ms")
+    for root, self_us in sorted(packages.items(), key=lambda item: -item[1])[:TOP]:
+        print(f"  {root:24s} {self_us / 1000:8.1f} ms")
+
+    imported = {name.split(".")[0] for name, _, _, _ in rows}
+    forbidden = sorted(imported.intersection(FORBIDDEN))
+    failures = []
+    if forbidden:
+        failures.append(f"forbidden modules imported at startup: {', '.join(forbidden)}")
+    if total_us / 1000 > BUDGET_MS:
+        failures.append(f"median {total_us / 1000:.0f} ms is over the {BUDGET_MS:.0f} ms budget")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Model scoring in the request thread vs in the process pool (app/inference_pool.py).
+
+Measures, with every model loaded and no prediction cache:
+
+- row:   latency of scoring one row (what /predict/{disease} does)
+- batch: per-row cost of scoring BENCH_BATCH_ROWS rows in one call
+- mixed: requests per second with BENCH_THREADS threads that each validate
+         a Parkinson payload (Pydantic, holds the GIL like the rest of a
+         request) and then score it, the scoring inline or in the pool
+
+The pool moves scoring off the GIL at the price of a pipe round trip per
+call, so it pays off when scoring is a large share of the request and there
+are free cores for the pool processes.
+
+    BENCH_PROCESSES=4 python benchmarks/inference_backend.py
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT_DIR)
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'backend.db')}")
+
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "5000"))
+BATCH_ROWS = int(os.getenv("BENCH_BATCH_ROWS", "1000"))
+THREADS = int(os.getenv("BENCH_THREADS", "8"))
+PROCESSES = int(os.getenv("BENCH_PROCESSES", str(os.cpu_count() or 1)))
+
+
+def measure(fn, rounds: int) -> float:
+    for _ in range(min(rounds, 200)):
+        fn()
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - started) / rounds * 1e6
+
+
+def mixed(score, body: dict, request_model) -> float:
+    """Requests per second of THREADS threads validating and scoring body."""
+    per_thread = max(ROUNDS // THREADS, 1)
+
+    def worker():
+        for _ in range(per_thread):
+            score(request_model.model_validate(body).row()[None, :])
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return per_thread * THREADS / (time.perf_counter() - started)
+
+
+def main():
+    import numpy as np
+
+    from app.features import PARKINSON
+    from app.inference_pool import InferencePool
+    from app.main import ParkinsonRequest
+    from app.model_predict import model_registry
+    from app.scoring import score_matrix
+
+    model_registry.load_all()
+    entry = model_registry.get("PARK")
+    pool = InferencePool(model_registry, PROCESSES, max(BATCH_ROWS, 1))
+    pool.start()
+
+    rng = np.random.default_rng(0)
+    x = PARKINSON.low + (PARKINSON.high - PARKINSON.low) * rng.random((BATCH_ROWS, PARKINSON.n_features))
+    row = x[:1]
+    body = {"patient": {"name": "Bench"}, "x": x[0].tolist()}
+    backends = {
+        "thread": lambda m: score_matrix(entry.scorer, m),
+        "process": lambda m: pool.score(entry, m),
+    }
+    expected = backends["thread"](x)
+    got = backends["process"](x)
+    assert np.array_equal(expected[0], got[0]) and np.array_equal(expected[1], got[1])
+
+    print(f"{os.cpu_count()} CPUs, {PROCESSES} pool processes, {THREADS} threads, batches of {BATCH_ROWS}")
+    for label, score in backends.items():
+        row_us = measure(lambda: score(row), ROUNDS)
+        batch_us = measure(lambda: score(x), max(ROUNDS // 50, 20)) / BATCH_ROWS
+        rps = mixed(score, body, ParkinsonRequest)
+        print(f"{label:8s} row {row_us:8.1f} us   batch {batch_us:6.3f} us/row   mixed {rps:8.0f} req/s")
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
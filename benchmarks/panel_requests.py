@@ -0,0 +1,117 @@
+"""Screening one patient for every disease: three POSTs vs one /predict/panel.
+
+For each patient, counts SQL statements and transactions and times the whole
+request through the ASGI app (TestClient, no network):
+
+- singles: POST /predict/diabetes, /predict/heart and /predict/parkinson
+- panel:   one POST /predict/panel with the union of the features
+
+Then times the scoring step of a panel both ways: one trip to the executor
+scoring the models one after the other (predict_rows), or one trip per model
+run concurrently with asyncio.gather (score_row, as /predict/panel does with
+MICROBATCH_ENABLED=1).
+
+    BENCH_DATABASE_URL=postgresql+psycopg2://... python benchmarks/panel_requests.py
+
+Defaults to a throwaway SQLite file. The target database gets the app's tables.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT_DIR)
+
+DEFAULT_URL = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'panel.db')}"
+os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL", DEFAULT_URL)
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from app.features import SPECS  # noqa: E402
+from app.main import app, run_inference, score_row  # noqa: E402
+from app.model_predict import predict_rows  # noqa: E402
+from app.utils.database import engine  # noqa: E402
+
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "200"))
+ENDPOINTS = {"DIAB": "/predict/diabetes", "HEART": "/predict/heart", "PARK": "/predict/parkinson"}
+FEATURES = {code: dict(zip(spec.order, ((spec.low + spec.high) / 2).tolist())) for code, spec in SPECS.items()}
+
+
+class StatementCounter:
+    def __init__(self):
+        self.statements = 0
+        self.transactions = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+        event.listen(engine, "commit", self._on_commit)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements += 1
+
+    def _on_commit(self, conn):
+        self.transactions += 1
+
+    def reset(self):
+        self.statements = 0
+        self.transactions = 0
+
+
+def singles(client, patient):
+    for code, path in ENDPOINTS.items():
+        response = client.post(path, json={"patient": patient, "features": FEATURES[code]})
+        response.raise_for_status()
+
+
+def panel(client, patient):
+    union = {f: v for features in FEATURES.values() for f, v in features.items()}
+    response = client.post("/predict/panel", json={"patient": patient, "features": union})
+    response.raise_for_status()
+
+
+def run(label, fn, client, counter):
+    counter.reset()
+    started = time.perf_counter()
+    for i in range(ROUNDS):
+        fn(client, {"name": "Bench", "email": f"{label}-{i}@bench.local"})
+    elapsed = time.perf_counter() - started
+    print(
+        f"{label:8s} statements/patient={counter.statements / ROUNDS:.2f} "
+        f"transactions/patient={counter.transactions / ROUNDS:.2f} ms/patient={elapsed / ROUNDS * 1000:.3f}"
+    )
+
+
+async def score_sequential(rows):
+    return await run_inference(predict_rows, rows)
+
+
+async def score_gathered(rows):
+    return await asyncio.gather(*(score_row(code, row) for code, row in rows.items()))
+
+
+async def time_scoring(fn, rows) -> float:
+    for _ in range(50):
+        await fn(rows)
+    started = time.perf_counter()
+    for _ in range(ROUNDS * 5):
+        await fn(rows)
+    return (time.perf_counter() - started) / (ROUNDS * 5) * 1e6
+
+
+def main():
+    counter = StatementCounter()
+    with TestClient(app) as client:
+        print(f"{engine.dialect.name}, {ROUNDS} new patients per case")
+        panel(client, {"name": "Warmup"})
+        run("singles", singles, client, counter)
+        run("panel", panel, client, counter)
+
+        # still inside the client: shutdown closes the inference executor
+        rows = {code: (spec.low + spec.high) / 2 for code, spec in SPECS.items()}
+        for label, fn in (("sequential", score_sequential), ("gathered", score_gathered)):
+            print(f"scoring {label:10s} {asyncio.run(time_scoring(fn, rows)):8.1f} us/panel")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Cost of the request metrics (app/metrics.py) on the request path.
+
+Times requests through the ASGI app (TestClient, no network) with
+METRICS_ENABLED=1 and METRICS_ENABLED=0, each in a fresh interpreter since
+the flag is read at import, alternating BENCH_RUNS times and keeping the
+median of each:
+
+- health:  GET /health, routing and serialization only
+- history: GET /diagnoses/history, one SELECT
+- predict: POST /predict/heart, parse, validation, inference and the write
+- render:  one GET /metrics after the runs above (metrics on only)
+
+    BENCH_DATABASE_URL=postgresql+psycopg2://... python benchmarks/request_metrics.py
+
+Defaults to a throwaway SQLite file per run.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "1000"))
+RUNS = int(os.getenv("BENCH_RUNS", "3"))
+CASES = ("health", "history", "predict", "render")
+
+
+def measure(fn, rounds: int) -> float:
+    for _ in range(min(rounds, 100)):
+        fn()
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - started) / rounds * 1e6
+
+
+def child() -> None:
+    """One run: print {case: us/request} as JSON."""
+    sys.path.insert(0, ROOT_DIR)
+    from fastapi.testclient import TestClient
+
+    from app.features import HEART
+    from app.main import app
+
+    features = dict(zip(HEART.order, ((HEART.low + HEART.high) / 2).tolist()))
+    counter = iter(range(10**9))
+
+    def predict():
+        patient = {"name": "Bench", "email": f"metrics-{next(counter)}@bench.local"}
+        client.post("/predict/heart", json={"patient": patient, "features": features}).raise_for_status()
+
+    results = {}
+    with TestClient(app) as client:
+        results["health"] = measure(lambda: client.get("/health").raise_for_status(), ROUNDS)
+        results["history"] = measure(
+            lambda: client.get("/diagnoses/history", params={"limit": 10}).raise_for_status(), ROUNDS
+        )
+        results["predict"] = measure(predict, ROUNDS)
+        if os.environ["METRICS_ENABLED"] == "1":
+            results["render"] = measure(lambda: client.get("/metrics").raise_for_status(), 100)
+    print(json.dumps(results))
+
+
+def run_once(enabled: bool) -> dict:
+    env = dict(os.environ)
+    env["METRICS_ENABLED"] = "1" if enabled else "0"
+    env["DATABASE_URL"] = os.getenv(
+        "BENCH_DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'metrics.db')}"
+    )
+    proc = subprocess.run(
+        [sys.executable, __file__, "--child"], cwd=ROOT_DIR, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        sys.exit(proc.stderr)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    runs = {True: [], False: []}
+    for _ in range(RUNS):
+        for enabled in (False, True):
+            runs[enabled].append(run_once(enabled))
+    print(f"{ROUNDS} requests per case, median of {RUNS} runs (us/request)")
+    print(f"{'case':8s} {'off':>9s} {'on':>9s} {'overhead':>9s}")
+    for case in CASES:
+        on = statistics.median(run[case] for run in runs[True])
+        if case == "render":
+            print(f"{case:8s} {'':>9s} {on:9.1f}")
+            continue
+        off = statistics.median(run[case] for run in runs[False])
+        print(f"{case:8s} {off:9.1f} {on:9.1f} {on - off:+9.1f}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--child"]:
+        child()
+    else:
+        main()
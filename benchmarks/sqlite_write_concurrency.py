@@ -0,0 +1,97 @@
+"""Diagnosis writes per second on SQLite as concurrent writers grow.
+
+Each thread persists BENCH_WRITES diagnoses with crud.create_patient_diagnosis,
+under three setups:
+
+- default:  plain engine (rollback journal, no pragmas), one commit per write
+- wal:      the app engine with the SQLite profile pragmas, one commit per write
+- writer:   the app engine with every write submitted to a SingleWriter,
+            which group-commits whatever is queued
+
+    python benchmarks/sqlite_write_concurrency.py
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT_DIR)
+
+BENCH_DIR = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(BENCH_DIR, 'wal.db')}"
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import app.models  # noqa: E402,F401  (registers the tables)
+from app.utils import crud  # noqa: E402
+from app.utils.database import Base, SessionLocal, engine  # noqa: E402
+from app.utils.writer import SingleWriter  # noqa: E402
+
+WRITES = int(os.getenv("BENCH_WRITES", "200"))
+THREADS = [int(n) for n in os.getenv("BENCH_THREADS", "1,4,16,64").split(",")]
+
+
+def persist(db, i):
+    crud.create_patient_diagnosis(db, f"P{i}", f"p{i % 500}@bench.local", None, None, "DIAB", 0.5, "bench")
+
+
+def setup(session_factory, bind):
+    Base.metadata.create_all(bind=bind)
+    with session_factory() as db:
+        crud.seed_default_diseases(db)
+
+
+def direct(session_factory):
+    def write(i):
+        with session_factory() as db:
+            persist(db, i)
+            db.commit()
+
+    return write
+
+
+def run(label, write, threads):
+    errors = []
+
+    def worker(offset):
+        for i in range(WRITES):
+            try:
+                write(offset + i)
+            except Exception as exc:  # "database is locked" and friends
+                errors.append(exc)
+
+    pool = [threading.Thread(target=worker, args=(t * WRITES,)) for t in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    done = threads * WRITES - len(errors)
+    print(f"{label:8s} threads={threads:3d} writes/s={done / elapsed:8.0f} errors={len(errors)}")
+
+
+def main():
+    default_engine = create_engine(
+        f"sqlite:///{os.path.join(BENCH_DIR, 'default.db')}",
+        connect_args={"check_same_thread": False},
+        pool_size=64,
+    )
+    DefaultSession = sessionmaker(bind=default_engine, autoflush=False)
+    setup(DefaultSession, default_engine)
+    setup(SessionLocal, engine)
+
+    writer = SingleWriter("bench", SessionLocal)
+    for threads in THREADS:
+        run("default", direct(DefaultSession), threads)
+        run("wal", direct(SessionLocal), threads)
+        run("writer", lambda i: writer.submit(persist, i).result(), threads)
+    writer.close()
+    print(writer.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Count SQL statements and round trips spent persisting one prediction.
+
+Compares the sequence the API used before crud.create_patient_diagnosis
+(SELECT the patient, INSERT it and flush, INSERT the diagnosis and flush for
+its id, INSERT the detail, commit), inlined in legacy() because the crud
+helpers it called have since been rewritten, with crud.create_patient_diagnosis.
+
+    BENCH_DATABASE_URL=postgresql+psycopg2://... python benchmarks/statements_per_prediction.py
+
+Defaults to a throwaway SQLite file. The target database gets the app's tables.
+"""
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT_DIR)
+
+DEFAULT_URL = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL", DEFAULT_URL)
+
+from sqlalchemy import event  # noqa: E402
+
+from app.models import Diagnosis, DiagnosisDetail, User  # noqa: E402
+from app.utils import crud  # noqa: E402
+from app.utils.database import Base, SessionLocal, engine  # noqa: E402
+
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "200"))
+
+
+class StatementCounter:
+    def __init__(self):
+        self.statements = 0
+        self.transactions = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+        event.listen(engine, "commit", self._on_commit)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements += 1
+
+    def _on_commit(self, conn):
+        self.transactions += 1
+
+    def reset(self):
+        self.statements = 0
+        self.transactions = 0
+
+
+def legacy(db, email):
+    user = db.query(User).filter(User.email == email).first()
+    if not user:
+        user = User(name="Bench", email=email)
+        db.add(user)
+        db.flush()
+    diagnosis = Diagnosis(user_id=user.id, final_description="bench", status="pending")
+    db.add(diagnosis)
+    db.flush()
+    disease_id = crud.disease_registry.get_id(db, "DIAB")
+    db.add(DiagnosisDetail(diagnosis_id=diagnosis.id, disease_id=disease_id, probability=0.5))
+    db.commit()
+
+
+def current(db, email):
+    crud.create_patient_diagnosis(db, "Bench", email, None, None, "DIAB", 0.5, "bench")
+    db.commit()
+
+
+def run(label, fn, counter, new_patients):
+    counter.reset()
+    started = time.perf_counter()
+    for i in range(ROUNDS):
+        email = f"{label}-{i}@bench.local" if new_patients else f"{label}@bench.local"
+        with SessionLocal() as db:
+            fn(db, email)
+    elapsed = time.perf_counter() - started
+    kind = "new patient" if new_patients else "known patient"
+    # every transaction also costs its COMMIT round trip
+    round_trips = (counter.statements + counter.transactions) / ROUNDS
+    print(
+        f"{label:8s} {kind:14s} statements/request={counter.statements / ROUNDS:.2f} "
+        f"round_trips/request={round_trips:.2f} ms/request={elapsed / ROUNDS * 1000:.3f}"
+    )
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        crud.seed_default_diseases(db)
+
+    print(f"{engine.dialect.name}, {ROUNDS} requests per case")
+    counter = StatementCounter()
+    for new_patients in (True, False):
+        run("legacy", legacy, counter, new_patients)
+        run("current", current, counter, new_patients)
+
+
+if __name__ == "__main__":
+    main()
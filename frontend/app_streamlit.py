@@ -569,10 +569,32 @@ elif selected == t["history"]:
             params["name"] = filter_name.strip()
         if filter_email.strip():
             params["email"] = filter_email.strip()
+        st.session_state["history_params"] = params
+        # Cursor of every page visited so far; None is the first page
+        st.session_state["history_cursors"] = [None]
+
+    if st.session_state.get("history_params") is not None:
+        cursors = st.session_state["history_cursors"]
+        params = dict(st.session_state["history_params"])
+        if cursors[-1]:
+            params["cursor"] = cursors[-1]
         data, err = api_get("/diagnoses/history", params=params)
         if err:
             st.error(f"Error al consultar historial: {err}")
-        elif not data:
-            st.info(t["history_empty"])
         else:
-            st.dataframe(data, use_container_width=True)
+            if not data["items"]:
+                st.info(t["history_empty"])
+            else:
+                st.dataframe(data["items"], use_container_width=True)
+
+            col_prev, col_page, col_next = st.columns([1, 2, 1])
+            with col_prev:
+                if len(cursors) > 1 and st.button(t["history_prev_page"]):
+                    cursors.pop()
+                    st.rerun()
+            with col_page:
+                st.caption(t["history_page"].format(page=len(cursors)))
+            with col_next:
+                if data["next_cursor"] and st.button(t["history_next_page"]):
+                    cursors.append(data["next_cursor"])
+                    st.rerun()
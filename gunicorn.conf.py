@@ -0,0 +1,38 @@
+"""gunicorn settings for the API: several uvicorn workers behind one port.
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+The app is imported once by the master (preload_app) and the workers are
+forked from it, so they start in milliseconds and share the imported code;
+after_fork() then gives each worker its own database connections. Models are
+loaded by each worker on first use, memory-mapped, so their pages are shared
+as well. `kill -HUP <master pid>` replaces every worker, which reloads the
+models; `kill -HUP <worker pid>` reloads the changed models of that worker only.
+"""
+import os
+
+
+def _cpu_count() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on macOS
+        return os.cpu_count() or 1
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", str(_cpu_count())))
+# read by the app: INFERENCE_PROCESSES defaults to the cores left per worker
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+accesslog = "-" if os.getenv("GUNICORN_ACCESS_LOG", "0") == "1" else None
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from app.main import after_fork
+
+        after_fork()
@@ -0,0 +1,27 @@
+"""/predict/{disease}/batch reports each invalid row in `errors` and scores the rest."""
+from fastapi.testclient import TestClient
+
+from app.features import DIABETES
+from app.main import app
+
+FEATURES = dict(zip(DIABETES.order, ((DIABETES.low + DIABETES.high) / 2).tolist()))
+
+
+def test_invalid_rows_do_not_fail_the_batch():
+    items = [
+        {"patient": {"name": "Valida", "email": "batch-0@test.local"}, "features": FEATURES},
+        {"patient": {"name": "Genero", "gender": "X"}, "features": FEATURES},
+        {"patient": {"email": "batch-2@test.local"}, "features": FEATURES},
+        {"patient": {"name": "Rango"}, "features": {**FEATURES, DIABETES.order[0]: -1.0}},
+        {"patient": {"name": "Valida", "email": "batch-4@test.local"}, "x": list(FEATURES.values())},
+    ]
+    with TestClient(app) as client:
+        response = client.post("/predict/diabetes/batch", json={"items": items})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [row["index"] for row in body["results"]] == [0, 4]
+    errors = {error["index"]: error["error"] for error in body["errors"]}
+    assert sorted(errors) == [1, 2, 3]
+    assert errors[1].startswith("patient.gender")
+    assert errors[2].startswith("patient.name")
@@ -0,0 +1,80 @@
+"""The diagnosis history queries are served by the indexes of the history migration."""
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine, event, insert, text
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Diagnosis, DiagnosisDetail, User
+from app.utils import crud
+from app.utils.database import Base
+from app.utils.migrations import run_migrations
+
+USERS = 500
+DIAGNOSES = 5000
+
+
+@pytest.fixture(scope="module")
+def engine(tmp_path_factory):
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('history') / 'history.db'}")
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        crud.seed_default_diseases(db)
+        db.execute(insert(User), [{"name": f"Paciente {i}", "email": f"p{i}@test.local"} for i in range(USERS)])
+        user_ids = [u for (u,) in db.query(User.id)]
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        rng = random.Random(0)
+        db.execute(
+            insert(Diagnosis),
+            [
+                {"user_id": rng.choice(user_ids), "generated_at": start + timedelta(minutes=i), "final_description": "t"}
+                for i in range(DIAGNOSES)
+            ],
+        )
+        disease_id = crud.disease_registry.get_id(db, "DIAB")
+        db.execute(
+            insert(DiagnosisDetail),
+            [{"diagnosis_id": d, "disease_id": disease_id, "probability": 0.5} for (d,) in db.query(Diagnosis.id)],
+        )
+        db.commit()
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    yield engine
+    engine.dispose()
+
+
+def history_plan(engine, filters: dict) -> str:
+    """EXPLAIN QUERY PLAN of the statement crud.get_diagnosis_history runs for filters."""
+    captured = []
+
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        with sessionmaker(bind=engine)() as db:
+            crud.get_diagnosis_history(db, 50, None, **filters)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    statement, parameters = captured[-1]
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+    return "\n".join(" ".join(str(col) for col in row) for row in rows)
+
+
+@pytest.mark.parametrize(
+    "filters, indexes",
+    [
+        ({}, ["ix_diagnoses_generated_at"]),
+        ({"email": "p7@test.local"}, ["ix_diagnoses_user_id_generated_at"]),
+        ({"name": "PACIENTE 7"}, ["ix_users_name_lower", "ix_diagnoses_user_id_generated_at"]),
+    ],
+    ids=["recent", "by-email", "by-name"],
+)
+def test_history_query_uses_indexes(engine, filters, indexes):
+    plan = history_plan(engine, filters)
+    for index in indexes:
+        assert index in plan, plan
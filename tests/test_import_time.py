@@ -0,0 +1,50 @@
+"""Import-time budget of the API's startup path (see benchmarks/import_time.py for the breakdown)."""
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "1500"))
+FORBIDDEN = ("sklearn", "scipy", "joblib", "threadpoolctl", "pandas", "streamlit")
+RUNS = 3
+
+# what a worker does before serving its first prediction
+STARTUP = "import app.main\nfrom app.model_predict import model_registry\nmodel_registry.load_all()\n"
+
+
+def import_times(env: dict) -> list:
+    """[(module, cumulative_us, depth)] from one `python -X importtime` run."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP],
+        cwd=ROOT_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    assert proc.returncode == 0, proc.stderr
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(cumulative_us), (len(name) - len(name.lstrip())) // 2))
+    return rows
+
+
+def test_startup_imports_within_budget(tmp_path):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = ROOT_DIR
+    # an empty compile cache, as in a fresh container: only exported models avoid the pickle
+    env["MODEL_CACHE_DIR"] = str(tmp_path / "compiled")
+    # a deployed worker imports from bytecode, not from source
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+
+    import_times(env)  # writes the bytecode, so every measured run starts alike
+    runs = [import_times(env) for _ in range(RUNS)]
+    totals_ms = sorted(sum(us for _, us, depth in rows if depth == 0) / 1000 for rows in runs)
+    median_ms = totals_ms[len(totals_ms) // 2]
+    assert median_ms <= BUDGET_MS, f"startup imports take {median_ms:.0f} ms, budget {BUDGET_MS:.0f} ms"
+
+    imported = {name.split(".")[0] for name, _, _ in runs[0]}
+    assert not imported.intersection(FORBIDDEN), f"imported at startup: {sorted(imported.intersection(FORBIDDEN))}"
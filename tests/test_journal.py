@@ -0,0 +1,86 @@
+"""WriteBehindJournal: transient failures are retried, poison records are dead-lettered."""
+import sqlite3
+import time
+
+import pytest
+
+from app.utils.journal import WriteBehindJournal
+
+
+class Database:
+    """apply_fn stand-in: stores records by ref, rejects refs in `poison` and fails while `down`."""
+
+    def __init__(self, poison=()):
+        self.poison = set(poison)
+        self.down = False
+        self.stored = {}
+
+    def apply(self, records):
+        if self.down:
+            raise ConnectionError("database unavailable")
+        if any(r["ref"] in self.poison for r in records):
+            raise ValueError("unknown disease")
+        for r in records:
+            self.stored.setdefault(r["ref"], r)
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / "journal.db")
+
+
+def test_poison_records_are_dead_lettered(journal_path):
+    db = Database(poison={3, 17})
+    journal = WriteBehindJournal(journal_path, db.apply, batch_size=20)
+    journal.append([{"ref": i} for i in range(25)])
+
+    assert journal.drain_once() == 20
+    assert journal.drain_once() == 5
+    assert journal.drain_once() == 0
+    assert sorted(db.stored) == [i for i in range(25) if i not in (3, 17)]
+
+    stats = journal.stats()
+    assert stats["depth"] == 0
+    assert stats["dead_letters"] == 2
+    with sqlite3.connect(journal_path) as conn:
+        dead = conn.execute("SELECT payload, error FROM dead_letters ORDER BY id").fetchall()
+    assert [payload for payload, _ in dead] == ['{"ref": 3}', '{"ref": 17}']
+    assert all("unknown disease" in error for _, error in dead)
+
+
+def test_retryable_errors_keep_the_batch(journal_path):
+    db = Database()
+    journal = WriteBehindJournal(journal_path, db.apply, batch_size=10)
+    journal.append([{"ref": i} for i in range(5)])
+
+    db.down = True
+    with pytest.raises(ConnectionError):
+        journal.drain_once()
+    assert journal.stats()["depth"] == 5
+
+    db.down = False
+    assert journal.drain_once() == 5
+    assert sorted(db.stored) == list(range(5))
+    assert journal.stats()["dead_letters"] == 0
+
+
+def test_synchronous_defaults_to_full(journal_path):
+    journal = WriteBehindJournal(journal_path, Database().apply)
+    # 2 = FULL
+    assert journal._conn.execute("PRAGMA synchronous").fetchone()[0] == 2
+
+
+def test_restart_after_close_keeps_draining(journal_path):
+    db = Database()
+    journal = WriteBehindJournal(journal_path, db.apply, interval_ms=10)
+    journal.start()
+    journal.close()
+
+    journal.start()
+    journal.append([{"ref": 1}])
+    deadline = time.monotonic() + 5
+    while 1 not in db.stored and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert journal._thread.is_alive()
+    journal.close()
+    assert sorted(db.stored) == [1]
@@ -0,0 +1,63 @@
+"""The app serves predictions again after a shutdown and a new startup in the same process."""
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.features import DIABETES
+from app.main import app
+from app.utils.writer import SingleWriter
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+FEATURES = dict(zip(DIABETES.order, ((DIABETES.low + DIABETES.high) / 2).tolist()))
+
+
+def predict_in_lifespan(run: int, statuses: list) -> None:
+    with TestClient(app) as client:
+        response = client.post(
+            "/predict/diabetes",
+            json={"patient": {"name": "Ciclo", "email": f"lifespan-{run}@test.local"}, "features": FEATURES},
+        )
+        statuses.append(response.status_code)
+
+
+def test_two_lifespans_each_predict():
+    for run in range(2):
+        statuses = []
+        # a daemon thread, so a request hung on a writer stopped by the first shutdown fails the test
+        thread = threading.Thread(target=predict_in_lifespan, args=(run, statuses), daemon=True)
+        thread.start()
+        thread.join(timeout=30)
+        assert statuses == [200], f"lifespan {run} did not answer"
+
+
+def test_closed_writer_rejects_jobs_until_restarted():
+    writer = SingleWriter("test", session_factory=lambda: None)
+    writer.close()
+    with pytest.raises(RuntimeError):
+        writer.submit(lambda db: None)
+    writer.start()
+    assert writer._thread.is_alive()
+    writer.close()
+    assert writer._thread is None
+
+
+def test_two_lifespans_each_predict_in_async_mode(tmp_path):
+    # DB_ASYNC is read at import, so this runs in its own interpreter
+    script = (
+        "from tests.test_lifespan import predict_in_lifespan\n"
+        "statuses = []\n"
+        "for run in range(2):\n"
+        "    predict_in_lifespan(run, statuses)\n"
+        "print(statuses)\n"
+    )
+    env = dict(os.environ, DB_ASYNC="1", DATABASE_URL=f"sqlite:///{tmp_path / 'async.db'}")
+    proc = subprocess.run(
+        [sys.executable, "-c", script], cwd=ROOT_DIR, env=env, capture_output=True, text=True, timeout=120
+    )
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout.strip().splitlines()[-1] == "[200, 200]"
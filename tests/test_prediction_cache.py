@@ -0,0 +1,24 @@
+"""PredictionCache keys: an entry is only ever returned for the exact same input."""
+import numpy as np
+
+from app.features import PARKINSON
+from app.model_predict import PredictionCache
+
+
+def test_key_distinguishes_tiny_features():
+    cache = PredictionCache(max_size=10)
+    row = (PARKINSON.low + PARKINSON.high) / 2
+    row[PARKINSON.order.index("jitter_abs")] = 1.2e-5
+    other = row.copy()
+    other[PARKINSON.order.index("jitter_abs")] = 1.2000004e-5
+
+    cache.put(cache.key("PARK", "v1", row), (1, 0.9))
+    assert cache.get(cache.key("PARK", "v1", row)) == (1, 0.9)
+    assert cache.get(cache.key("PARK", "v1", other)) is None
+    assert cache.get(cache.key("PARK", "v2", row)) is None
+
+
+def test_key_ignores_array_layout():
+    cache = PredictionCache(max_size=10)
+    x = np.arange(6, dtype=np.float64).reshape(2, 3)
+    assert cache.key("DIAB", "v1", x[:, 0]) == cache.key("DIAB", "v1", np.array([0.0, 3.0]))
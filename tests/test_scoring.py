@@ -0,0 +1,82 @@
+"""The compiled kernels (app/scoring.py) score exactly like the pickled estimators."""
+import os
+import pickle
+import warnings
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sklearn")  # the inference-only install cannot unpickle the estimators
+
+from app.features import SPECS  # noqa: E402
+from app.model_predict import DIABETES_MODEL_FILE, HEART_MODEL_FILE, MODEL_DIR, PARK_MODEL_FILE  # noqa: E402
+from app.scoring import LinearModel, compile_model, load_linear_model, score_matrix  # noqa: E402
+
+MODEL_FILES = {"DIAB": DIABETES_MODEL_FILE, "HEART": HEART_MODEL_FILE, "PARK": PARK_MODEL_FILE}
+ROWS = 2000
+
+# the estimators were fitted on DataFrames; the API scores plain arrays
+pytestmark = pytest.mark.filterwarnings("ignore:X does not have valid feature names")
+
+
+def load_estimator(code: str):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # pickled with an older scikit-learn
+        with open(os.path.join(MODEL_DIR, MODEL_FILES[code]), "rb") as f:
+            return pickle.load(f)
+
+
+def random_matrix(code: str) -> np.ndarray:
+    spec = SPECS[code]
+    rng = np.random.default_rng(20240611)
+    return rng.uniform(spec.low, spec.high, size=(ROWS, spec.n_features))
+
+
+def expected_scores(estimator, x: np.ndarray):
+    labels = estimator.predict(x)
+    if hasattr(estimator, "predict_proba"):
+        return labels, estimator.predict_proba(x)[:, 1]
+    return labels, np.where(labels == 1, 1.0, 0.0)
+
+
+@pytest.mark.parametrize("code", sorted(MODEL_FILES))
+def test_compiled_kernel_matches_estimator(code):
+    estimator = load_estimator(code)
+    x = random_matrix(code)
+    compiled = compile_model(estimator)
+    assert isinstance(compiled, LinearModel)
+
+    expected_labels, expected_probas = expected_scores(estimator, x)
+    labels, probas = score_matrix(compiled, x)
+    np.testing.assert_array_equal(labels, expected_labels)
+    np.testing.assert_allclose(probas, expected_probas, rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize("code", sorted(MODEL_FILES))
+def test_exported_model_matches_estimator(code):
+    estimator = load_estimator(code)
+    x = random_matrix(code)
+    stem = os.path.join(MODEL_DIR, os.path.splitext(MODEL_FILES[code])[0])
+    exported, header = load_linear_model(stem)
+    assert isinstance(exported.weights, np.memmap) or isinstance(exported.weights.base, np.memmap)
+    assert header["feature_order"] == SPECS[code].order
+
+    expected_labels, expected_probas = expected_scores(estimator, x)
+    labels, probas = score_matrix(exported, x)
+    np.testing.assert_array_equal(labels, expected_labels)
+    np.testing.assert_allclose(probas, expected_probas, rtol=0, atol=1e-12)
+
+
+def test_platt_scaled_svc_matches_predict_proba():
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.svm import SVC
+
+    x = random_matrix("DIAB")
+    y = (x[:, 1] + np.random.default_rng(0).normal(0, 40, ROWS) > 150).astype(int)
+    estimator = make_pipeline(StandardScaler(), SVC(kernel="linear", probability=True, random_state=0))
+    estimator.fit(x[:200], y[:200])
+
+    labels, probas = score_matrix(compile_model(estimator), x)
+    np.testing.assert_array_equal(labels, estimator.predict(x))
+    np.testing.assert_allclose(probas, estimator.predict_proba(x)[:, 1], rtol=0, atol=1e-12)
@@ -117,9 +117,12 @@ translations = {
         "history_intro": "Consulta los diagnosticos registrados por la aplicacion.",
         "history_filter_name": "Filtrar por nombre (opcional)",
         "history_filter_email": "Filtrar por correo (opcional)",
-        "history_limit_label": "Numero maximo de registros a mostrar",
+        "history_limit_label": "Diagnosticos por pagina",
         "history_show_button": "Mostrar historial",
         "history_empty": "Aun no hay diagnosticos registrados.",
+        "history_prev_page": "Pagina anterior",
+        "history_next_page": "Pagina siguiente",
+        "history_page": "Pagina {page}",
 
         # RECOMENDACIONES MÉDICAS (AÑADIDAS)
         "positive_heart_reco": """
@@ -287,9 +290,12 @@ Recomendaciones:
         "history_intro": "Browse the diagnoses stored by the application.",
         "history_filter_name": "Filter by name (optional)",
         "history_filter_email": "Filter by email (optional)",
-        "history_limit_label": "Max records to show",
+        "history_limit_label": "Diagnoses per page",
         "history_show_button": "Show history",
         "history_empty": "No diagnoses have been stored yet.",
+        "history_prev_page": "Previous page",
+        "history_next_page": "Next page",
+        "history_page": "Page {page}",
 
         # RECOMENDACIONES MÉDICAS (AÑADIDAS)
         "positive_heart_reco": """